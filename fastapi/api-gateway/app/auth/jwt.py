@@ -0,0 +1,91 @@
+import hashlib
+import hmac
+import time
+from cachetools import TLRUCache
+from jose import jwt, JWTError
+from app.config import settings
+
+ALGORITHM = "HS256"
+
+# Carries the user verified here to room-service, which trusts it instead of
+# decoding the token again. Any copy sent by a client is dropped.
+IDENTITY_HEADER = "x-quickdraw-identity"
+
+
+def derive_identity_key(secret_key: str) -> bytes:
+    return hmac.new(secret_key.encode("utf-8"), b"quickdraw-identity", hashlib.sha256).digest()
+
+
+def sign_identity(identity_key: bytes, user_id: str, exp: float) -> str:
+    message = f"{user_id}.{int(exp)}"
+    signature = hmac.new(identity_key, message.encode("utf-8"), hashlib.sha256).hexdigest()
+    return f"{message}.{signature}"
+
+
+class TokenVerifier:
+    # Verified tokens are remembered by hash until they expire, so a client
+    # polling with the same token only pays for decoding it once.
+    _instance = None
+
+    def __init__(self, secret_key: str, max_entries: int):
+        self.secret_key = secret_key
+        self.identity_key = derive_identity_key(secret_key)
+        # sha256(token) -> (identity header, exp)
+        self.tokens: TLRUCache = TLRUCache(
+            maxsize=max_entries,
+            ttu=lambda _key, verified, _now: verified[1],
+            timer=time.time
+        )
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    @classmethod
+    def get_instance(cls, secret_key: str, max_entries: int) -> "TokenVerifier":
+        if cls._instance is None:
+            cls._instance = cls(secret_key, max_entries)
+        return cls._instance
+
+    def get_identity(self, authorization: str | None) -> str | None:
+        if not authorization or not authorization.startswith("Bearer "):
+            return None
+
+        token = authorization.split(" ")[1]
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        verified = self.tokens.get(key)
+        if verified is not None:
+            self.hits += 1
+            return verified[0]
+
+        self.misses += 1
+        verified = self.verify(token)
+        if verified is None:
+            # Left for the service to reject with its usual error
+            self.failures += 1
+            return None
+        self.tokens[key] = verified
+        return verified[0]
+
+    def verify(self, token: str) -> tuple[str, float] | None:
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+
+        user_id = payload.get("id")
+        exp = payload.get("exp")
+        if not user_id or exp is None or exp <= time.time():
+            return None
+        return sign_identity(self.identity_key, user_id, exp), exp
+
+    def snapshot(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "cached_tokens": len(self.tokens),
+        }
+
+
+async def get_token_verifier() -> TokenVerifier:
+    return TokenVerifier.get_instance(settings.SECRET_KEY, settings.AUTH_CACHE_SIZE)
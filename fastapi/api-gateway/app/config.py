@@ -2,11 +2,32 @@ from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
+    SECRET_KEY: str
     BASE_URL: str
     USER_SERVICE_URL: str
     ROOM_SERVICE_URL: str
     DRAW_SERVICE_URL: str
     TIME_OUT: float = 10.0
+    AUTH_CACHE_SIZE: int = 10000
+    # Per-service overrides of TIME_OUT, e.g. {"draw": 30}
+    SERVICE_TIMEOUTS: dict[str, float] = {}
+    UPSTREAM_MAX_CONNECTIONS: int = 100
+    UPSTREAM_MAX_KEEPALIVE: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0
+    # Only takes effect against https backends; httpx does not speak h2c
+    UPSTREAM_HTTP2: bool = False
+    CACHE_ENABLED: bool = True
+    # "{service}/{path}" glob -> TTL in seconds, first match wins
+    CACHE_ROUTES: dict[str, float] = {"room": 2.0, "room/*": 5.0}
+    # Cached separately for every Authorization header
+    CACHE_PER_USER_ROUTES: list[str] = ["room/current"]
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_MAX_BODY_BYTES: int = 262144
+    CACHE_REDIS_URL: str | None = None
+    COALESCE_ENABLED: bool = True
+    # "{service}/{path}" glob -> seconds a duplicate GET waits for the first
+    COALESCE_ROUTES: dict[str, float] = {"room": 2.0, "room/*": 2.0, "draw/*": 5.0}
+    COALESCE_MAX_BODY_BYTES: int = 1048576
 
     class Config:
         env_file = ".env"
@@ -1,9 +1,22 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from app.routes import proxy
+from app.services.upstream_clients import UpstreamClients
+from app.services.response_cache import ResponseCache
 from app.config import settings
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        UpstreamClients.get_instance(proxy.SERVICE_URLS)
+        yield
+    finally:
+        await UpstreamClients.close_instance()
+        await ResponseCache.close_instance()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://127.0.0.1:8000",
@@ -22,6 +35,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Seq"],
 )
 
 app.include_router(proxy.router)
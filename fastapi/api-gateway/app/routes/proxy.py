@@ -1,7 +1,14 @@
-from fastapi import APIRouter, Request, Response, HTTPException
+from fastapi import APIRouter, Request, Response, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import logging
+import time
 from app.config import settings
+from app.auth.jwt import IDENTITY_HEADER, TokenVerifier, get_token_verifier
+from app.services.upstream_clients import UpstreamClients, UpstreamClient
+from app.services.response_cache import ResponseCache, CachedResponse, get_response_cache, make_etag, etag_matches
+from app.services.single_flight import SingleFlight, get_single_flight
 
 router = APIRouter()
 
@@ -13,46 +20,180 @@ SERVICE_URLS = {
 
 logger = logging.getLogger(__name__)
 
+# Apply to a single connection and are not forwarded by proxies (RFC 9110)
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+# uvicorn adds its own
+SERVER_HEADERS = {"date", "server"}
+# A successful one drops the service's cached responses
+WRITE_METHODS = {"POST", "PUT", "DELETE", "PATCH"}
+
+
+async def get_upstream_clients() -> UpstreamClients:
+    return UpstreamClients.get_instance(SERVICE_URLS)
+
+
+def cached_response(request: Request, entry: CachedResponse, response_cache: ResponseCache) -> Response:
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers={"etag": entry.etag})
+
+    response = Response(content=entry.body, status_code=entry.status_code)
+    for name, value in entry.headers:
+        response.headers.append(name, value)
+    if "etag" not in response.headers:
+        response.headers["etag"] = entry.etag
+    return response
+
+
+@router.get("/metrics")
+async def metrics(
+    upstream_clients: UpstreamClients = Depends(get_upstream_clients),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    single_flight: SingleFlight = Depends(get_single_flight),
+    token_verifier: TokenVerifier = Depends(get_token_verifier)
+):
+    return {
+        "upstream": upstream_clients.snapshot(),
+        "cache": response_cache.snapshot(),
+        "single_flight": single_flight.snapshot(),
+        "auth": token_verifier.snapshot(),
+    }
+
 
 @router.api_route("/api/v1/{service}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 @router.api_route("/api/v1/{service}/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
-async def proxy_request(request: Request, service: str, path: str = ""):
-    service_url = SERVICE_URLS.get(service)
-    if not service_url:
+async def proxy_request(
+    request: Request,
+    service: str,
+    path: str = "",
+    upstream_clients: UpstreamClients = Depends(get_upstream_clients),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    single_flight: SingleFlight = Depends(get_single_flight),
+    token_verifier: TokenVerifier = Depends(get_token_verifier)
+):
+    upstream = upstream_clients.get(service)
+    if upstream is None:
         logger.error(f"Service {service} not found in SERVICE_URLS.")
         raise HTTPException(status_code=404, detail="Service not found")
 
-    query_params = dict(request.query_params)
-    headers = dict(request.headers)
-    headers.pop("host", None)
+    route = f"{service}/{path}".rstrip("/")
+    ttl = max_wait = None
+    if request.method == "GET":
+        ttl = response_cache.get_ttl(route)
+        max_wait = single_flight.get_max_wait(route)
+    # Requests that would share a cache entry are identical for coalescing too
+    cache_key = None
+    if ttl is not None or max_wait is not None:
+        cache_key = response_cache.make_key(route, request.url.query, request.headers.get("authorization"))
+
+    if ttl is not None:
+        cached = await response_cache.get(service, cache_key)
+        if cached is not None:
+            return cached_response(request, cached, response_cache)
+
+    call = None
+    if max_wait is not None:
+        call = single_flight.lead(cache_key)
+        if call is None:
+            shared = await single_flight.follow(cache_key, max_wait)
+            if shared is not None:
+                return cached_response(request, shared, response_cache)
 
-    body = await request.body()
+    entry = None
+    try:
+        response = await send_upstream(request, service, path, upstream, token_verifier)
+
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            await response_cache.invalidate(service)
+
+        response_headers = [
+            (name, value) for name, value in response.headers.multi_items()
+            if name not in HOP_BY_HOP_HEADERS and name not in SERVER_HEADERS
+        ]
+
+        # Buffer small responses that are cached or awaited by followers
+        buffer_limit = max(
+            response_cache.max_body if ttl is not None else 0,
+            single_flight.max_body if call is not None else 0
+        )
+        content_length = response.headers.get("content-length")
+        if (response.status_code == 200
+                and content_length is not None and int(content_length) <= buffer_limit):
+            try:
+                body = b"".join([chunk async for chunk in response.aiter_raw()])
+            finally:
+                await upstream.release(response)
+            entry = CachedResponse(
+                response.status_code,
+                [(name, value) for name, value in response_headers if name != "content-length"],
+                body,
+                response.headers.get("etag") or make_etag(body),
+                time.time() + (ttl or 0)
+            )
+            if ttl is not None and len(body) <= response_cache.max_body:
+                await response_cache.set(service, cache_key, entry)
+            return cached_response(request, entry, response_cache)
+    finally:
+        # Followers share the buffered response, or go upstream themselves
+        single_flight.finish(cache_key, call, entry)
+
+    # Relay the body as it arrives, still encoded, so large responses are
+    # never parsed or held in the gateway
+    proxied = StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        background=BackgroundTask(upstream.release, response),
+    )
+    for name, value in response_headers:
+        proxied.headers.append(name, value)
+    return proxied
+
+
+async def send_upstream(
+    request: Request,
+    service: str,
+    path: str,
+    upstream: UpstreamClient,
+    token_verifier: TokenVerifier
+) -> httpx.Response:
+    service_url = upstream.base_url
+    query_params = request.query_params.multi_items()
+    headers = {
+        name: value for name, value in request.headers.items()
+        if name not in HOP_BY_HOP_HEADERS and name not in ("host", IDENTITY_HEADER)
+    }
+    identity = token_verifier.get_identity(request.headers.get("authorization"))
+    if identity is not None:
+        headers[IDENTITY_HEADER] = identity
+    # Only requests that carry a body get one streamed upstream
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
 
     logger.info(f"Proxying request to {service}:")
     logger.info(f"URL: {service_url}/{service}/{path}")
     logger.info(f"Headers: {headers}")
     logger.info(f"Query params: {query_params}")
-    logger.info(f"Body: {body.decode('utf-8') if body else None}")
 
     try:
-        async with httpx.AsyncClient(timeout=settings.TIME_OUT) as client:
-            response = await client.request(
-                method=request.method,
-                url=f"{service_url}/{path}" if path else service_url,
-                headers=headers,
-                params=query_params,
-                content=body,
-            )
-        logger.info(f"Response status: {response.status_code}")
-        logger.info(f"Response content: {response.text}")
-
-        if response.headers.get("content-type") == "application/json":
-            return response.json()
-        else:
-            return Response(content=response.content, media_type=response.headers.get("content-type"))
-
+        response = await upstream.send(upstream.client.build_request(
+            method=request.method,
+            url=f"{service_url}/{path}" if path else service_url,
+            headers=headers,
+            params=query_params,
+            content=request.stream() if has_body else None,
+        ))
     except httpx.RequestError as exc:
         logger.error(f"HTTP request to {service_url} failed: {exc}")
         raise HTTPException(
             status_code=500, detail=f"Error connecting to service: {service}"
         ) from exc
+    logger.info(f"Response status: {response.status_code}")
+    return response
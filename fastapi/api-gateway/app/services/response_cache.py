@@ -0,0 +1,196 @@
+import base64
+import hashlib
+import json
+import logging
+import time
+from fnmatch import fnmatchcase
+from cachetools import TLRUCache
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse:
+    def __init__(self, status_code: int, headers: list[tuple[str, str]], body: bytes, etag: str, expires_at: float):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+
+    def dumps(self) -> str:
+        return json.dumps({
+            "status_code": self.status_code,
+            "headers": self.headers,
+            "body": base64.b64encode(self.body).decode("ascii"),
+            "etag": self.etag,
+            "expires_at": self.expires_at,
+        })
+
+    @classmethod
+    def loads(cls, data: str | bytes) -> "CachedResponse":
+        fields = json.loads(data)
+        return cls(
+            fields["status_code"],
+            [tuple(header) for header in fields["headers"]],
+            base64.b64decode(fields["body"]),
+            fields["etag"],
+            fields["expires_at"],
+        )
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses weak comparison
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in (
+        candidate.removeprefix("W/") for candidate in candidates
+    )
+
+
+class ResponseCache:
+    # GET responses of the routes in CACHE_ROUTES, kept in a per-service LRU
+    # and, when CACHE_REDIS_URL is set, shared through Redis. Any successful
+    # write through the gateway drops everything cached for that service.
+    _instance = None
+
+    def __init__(
+        self,
+        routes: dict[str, float],
+        per_user_routes: list[str],
+        max_entries: int,
+        max_body: int,
+        redis_url: str | None
+    ):
+        self.routes = routes
+        self.per_user_routes = per_user_routes
+        self.max_entries = max_entries
+        self.max_body = max_body
+        self.memory: dict[str, TLRUCache] = {}
+        self.redis = Redis.from_url(redis_url) if redis_url else None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    @classmethod
+    def get_instance(
+        cls,
+        routes: dict[str, float],
+        per_user_routes: list[str],
+        max_entries: int,
+        max_body: int,
+        redis_url: str | None
+    ) -> "ResponseCache":
+        if cls._instance is None:
+            cls._instance = cls(routes, per_user_routes, max_entries, max_body, redis_url)
+        return cls._instance
+
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance:
+            await cls._instance.close()
+            cls._instance = None
+
+    def get_ttl(self, route: str) -> float | None:
+        for pattern, ttl in self.routes.items():
+            if fnmatchcase(route, pattern):
+                return ttl
+        return None
+
+    def make_key(self, route: str, query: str, authorization: str | None) -> str:
+        key = f"GET {route}?{query}"
+        if any(fnmatchcase(route, pattern) for pattern in self.per_user_routes):
+            key += f" {authorization or ''}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get_memory(self, service: str) -> TLRUCache:
+        memory = self.memory.get(service)
+        if memory is None:
+            memory = self.memory[service] = TLRUCache(
+                maxsize=self.max_entries,
+                ttu=lambda _key, entry, _now: entry.expires_at,
+                timer=time.time
+            )
+        return memory
+
+    async def get(self, service: str, key: str) -> CachedResponse | None:
+        memory = self.get_memory(service)
+        entry = memory.get(key)
+        if entry is None and self.redis is not None:
+            try:
+                data = await self.redis.hget(f"cache:{service}", key)
+            except RedisError as e:
+                logger.error(f"Response cache lookup failed: {e}")
+                data = None
+            if data is not None:
+                entry = CachedResponse.loads(data)
+                if entry.expires_at > time.time():
+                    memory[key] = entry
+                else:
+                    entry = None
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def set(self, service: str, key: str, entry: CachedResponse):
+        self.get_memory(service)[key] = entry
+        self.stores += 1
+        if self.redis is None:
+            return
+        # The hash lives as long as its longest-lived route; expired fields
+        # are skipped on read and go away with it.
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(f"cache:{service}", key, entry.dumps())
+                pipe.expire(f"cache:{service}", int(max(self.routes.values())) + 1)
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Response cache store failed: {e}")
+
+    async def invalidate(self, service: str):
+        self.get_memory(service).clear()
+        self.invalidations += 1
+        if self.redis is None:
+            return
+        try:
+            await self.redis.delete(f"cache:{service}")
+        except RedisError as e:
+            logger.error(f"Response cache invalidation failed: {e}")
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "not_modified": self.not_modified,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "entries": {service: len(memory) for service, memory in self.memory.items()},
+        }
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.close()
+
+
+async def get_response_cache() -> ResponseCache:
+    return ResponseCache.get_instance(
+        settings.CACHE_ROUTES if settings.CACHE_ENABLED else {},
+        settings.CACHE_PER_USER_ROUTES,
+        settings.CACHE_MAX_ENTRIES,
+        settings.CACHE_MAX_BODY_BYTES,
+        settings.CACHE_REDIS_URL
+    )
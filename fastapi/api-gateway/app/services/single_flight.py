@@ -0,0 +1,78 @@
+import asyncio
+from fnmatch import fnmatchcase
+from app.config import settings
+from app.services.response_cache import CachedResponse
+
+
+class SingleFlight:
+    # Identical GETs that arrive while one is upstream wait for its response
+    # instead of sending their own. Followers give up after the route's max
+    # wait, or when the leader's response is too large to share, and go
+    # upstream themselves.
+    _instance = None
+
+    def __init__(self, routes: dict[str, float], max_body: int):
+        self.routes = routes
+        self.max_body = max_body
+        self.calls: dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.fallbacks = 0
+
+    @classmethod
+    def get_instance(cls, routes: dict[str, float], max_body: int) -> "SingleFlight":
+        if cls._instance is None:
+            cls._instance = cls(routes, max_body)
+        return cls._instance
+
+    def get_max_wait(self, route: str) -> float | None:
+        for pattern, max_wait in self.routes.items():
+            if fnmatchcase(route, pattern):
+                return max_wait
+        return None
+
+    def lead(self, key: str) -> asyncio.Future | None:
+        if key in self.calls:
+            return None
+        call = self.calls[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        return call
+
+    async def follow(self, key: str, max_wait: float) -> CachedResponse | None:
+        try:
+            # shield: a follower timing out must not cancel the shared call
+            entry = await asyncio.wait_for(asyncio.shield(self.calls[key]), max_wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+
+        if entry is None:
+            self.fallbacks += 1
+        else:
+            self.coalesced += 1
+        return entry
+
+    def finish(self, key: str, call: asyncio.Future | None, entry: CachedResponse | None):
+        if call is None:
+            return
+        if self.calls.get(key) is call:
+            del self.calls[key]
+        if not call.done():
+            call.set_result(entry)
+
+    def snapshot(self) -> dict:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "fallbacks": self.fallbacks,
+            "in_flight": len(self.calls),
+        }
+
+
+async def get_single_flight() -> SingleFlight:
+    return SingleFlight.get_instance(
+        settings.COALESCE_ROUTES if settings.COALESCE_ENABLED else {},
+        settings.COALESCE_MAX_BODY_BYTES
+    )
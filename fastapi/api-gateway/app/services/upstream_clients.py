@@ -0,0 +1,93 @@
+import httpx
+from app.config import settings
+
+
+class UpstreamClient:
+    # One keep-alive connection pool per backend for the life of the app
+    def __init__(self, base_url: str, limits: httpx.Limits, timeout: float, http2: bool):
+        self.base_url = base_url
+        self.limits = limits
+        self.transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+        self.client = httpx.AsyncClient(transport=self.transport, timeout=timeout)
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.pool_timeouts = 0
+
+    async def send(self, request: httpx.Request) -> httpx.Response:
+        # The body is left unread; hand the response to release() once done
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self.client.send(request, stream=True)
+        except httpx.PoolTimeout:
+            self.pool_timeouts += 1
+            self.in_flight -= 1
+            raise
+        except BaseException:
+            self.in_flight -= 1
+            raise
+
+    async def release(self, response: httpx.Response):
+        await response.aclose()
+        self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        connections = self.transport._pool.connections
+        max_connections = self.limits.max_connections
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "pool_timeouts": self.pool_timeouts,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+            "max_connections": max_connections,
+            "saturation": self.in_flight / max_connections if max_connections else None,
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class UpstreamClients:
+    _instance = None
+
+    def __init__(self, service_urls: dict[str, str]):
+        limits = httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+        )
+        self.clients = {
+            service: UpstreamClient(
+                url,
+                limits,
+                settings.SERVICE_TIMEOUTS.get(service, settings.TIME_OUT),
+                settings.UPSTREAM_HTTP2
+            )
+            for service, url in service_urls.items()
+        }
+
+    @classmethod
+    def get_instance(cls, service_urls: dict[str, str]) -> "UpstreamClients":
+        if cls._instance is None:
+            cls._instance = cls(service_urls)
+        return cls._instance
+
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance:
+            await cls._instance.close()
+            cls._instance = None
+
+    def get(self, service: str) -> UpstreamClient | None:
+        return self.clients.get(service)
+
+    def snapshot(self) -> dict:
+        return {service: client.snapshot() for service, client in self.clients.items()}
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.close()
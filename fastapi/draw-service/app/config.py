@@ -7,6 +7,41 @@ class Settings(BaseSettings):
     API_GATEWAY_URL: str
     DRAW_DB_URL: str
     REDIS_HOST: str
+    REDIS_NODES: list[str] = []
+    DRAW_TICK_MS: int = 30
+    DRAW_FLUSH_INTERVAL: float = 5.0
+    DRAW_FLUSH_BATCH: int = 1000
+    DRAW_COPY_INGEST: bool = True
+    DRAW_CHUNK_SIZE: int = 4096
+    DRAW_SNAPSHOT_CHUNKS: int = 16
+    DRAW_SNAPSHOT_GROWTH: float = 0.5
+    DRAW_SNAPSHOT_TOLERANCE: float = 0.5
+    DRAW_SIMPLIFY_TOLERANCE: float = 0.0
+    DRAW_STREAM_MAXLEN: int = 10000
+    DRAW_STREAM_TTL: int = 3600
+    RESUME_MAX_EVENTS: int = 2000
+    SEND_QUEUE_MAX_BYTES: int = 1048576
+    SEND_QUEUE_MAX_DELAY: float = 2.0
+    ROOM_CAPACITY_TTL: int = 60
+    ROOM_DEFAULT_MAX_PLAYERS: int = 8
+    PRESENCE_HEARTBEAT_INTERVAL: float = 10.0
+    PRESENCE_TIMEOUT: float = 30.0
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_CONNECTION_RATE: float = 120.0
+    RATE_LIMIT_CONNECTION_BURST: int = 240
+    RATE_LIMIT_USER_RATE: float = 200.0
+    RATE_LIMIT_USER_BURST: int = 400
+    RATE_LIMIT_GLOBAL_PER_SEC: int = 0
+    RATE_LIMIT_OVERFLOW_BYTES: int = 65536
+    # Must match websocket-gateway's WS_MAX_SIZE
+    WS_MAX_SIZE: int = 1048576
+    WS_MAX_QUEUE: int = 16
+    WS_DEFLATE_ENABLED: bool = True
+    WS_DEFLATE_LEVEL: int = 6
+    WS_DEFLATE_WINDOW_BITS: int = 12
+    WS_DEFLATE_MEM_LEVEL: int = 5
+    WS_DEFLATE_CONTEXT_TAKEOVER: bool = True
+    WS_DEFLATE_MIN_SIZE: int = 128
 
     class Config:
         env_file = ".env"
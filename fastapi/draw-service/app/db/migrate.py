@@ -0,0 +1,37 @@
+import asyncio
+import logging
+from sqlalchemy import delete
+from sqlalchemy.future import select
+from app.db.connection import init_db, close_db, engine, session_factory
+from app.db.models import Drawing
+from app.services.db_managers import get_db_manager
+
+logger = logging.getLogger(__name__)
+
+
+async def migrate_legacy_drawings():
+    await init_db(engine)
+    db_manager = get_db_manager()
+
+    async with session_factory() as session:
+        result = await session.execute(select(Drawing.room_id).distinct())
+        room_ids = result.scalars().all()
+
+    for room_id in room_ids:
+        # Rows are deleted and re-written as chunks in the same transaction
+        async with session_factory() as session:
+            result = await session.execute(select(Drawing).where(Drawing.room_id == room_id))
+            drawings = [
+                {"x": drawing.x, "y": drawing.y, "prevX": drawing.prev_x, "prevY": drawing.prev_y}
+                for drawing in result.scalars()
+            ]
+            await session.execute(delete(Drawing).where(Drawing.room_id == room_id))
+            await db_manager.save_drawings(drawings, room_id, session)
+        logger.info(f"Migrated {len(drawings)} segments of room {room_id}")
+
+    await close_db(engine)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate_legacy_drawings())
@@ -1,7 +1,9 @@
 from uuid import UUID, uuid4
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, LargeBinary
 
 
+# Legacy one-row-per-segment storage, only read by app.db.migrate
 class Drawing(SQLModel, table=True):
     id: UUID = Field(primary_key=True, default_factory=uuid4, index=True)
     x: float
@@ -9,3 +11,23 @@ class Drawing(SQLModel, table=True):
     prev_x: float
     prev_y: float
     room_id: UUID = Field(index=True)
+
+
+class DrawingChunk(SQLModel, table=True):
+    __tablename__ = "drawing_chunk"
+
+    room_id: UUID = Field(primary_key=True)
+    seq: int = Field(primary_key=True)
+    segment_count: int
+    # Segments packed with app.services.stroke_codec.pack_points
+    points: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+class DrawingSnapshot(SQLModel, table=True):
+    __tablename__ = "drawing_snapshot"
+
+    room_id: UUID = Field(primary_key=True)
+    # Highest DrawingChunk.seq folded into this snapshot
+    seq: int
+    segment_count: int
+    points: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
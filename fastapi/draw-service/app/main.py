@@ -2,6 +2,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.db.connection import init_db, close_db, engine
+from app.services.redis_managers import RedisClient
+from app.services.room_hub import RoomHub
+from app.services.draw_batcher import DrawBatcherPool
+from app.services.draw_flusher import DrawFlusherPool
 from app.routes import draw
 from app.config import settings
 
@@ -12,6 +16,10 @@ async def lifespan(app: FastAPI):
         await init_db(engine)
         yield
     finally:
+        await DrawBatcherPool.close_instance()
+        await DrawFlusherPool.close_instance()
+        await RoomHub.close_instance()
+        await RedisClient.close_instance()
         await close_db(engine)
 
 app = FastAPI(
@@ -36,6 +44,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Seq"],
 )
 
 app.include_router(draw.router, prefix="/draw", tags=["Draw"])
@@ -1,22 +1,73 @@
+import re
 from uuid import UUID
-from fastapi import APIRouter, WebSocket, HTTPException, status, Depends
-from sqlalchemy.future import select
+from urllib.parse import urlsplit, parse_qs
+from typing import Optional
+from fastapi import APIRouter, WebSocket, HTTPException, Query, Response, status, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.services.websoket_sessions import RoomWebSocketSessionFactory
+from app.services.websoket_sessions import RoomWebSocketSessionFactory, MuxSessionFactory
+from app.services.mux import MuxConnection, VirtualWebSocket
+from app.services.compression import stats as compression_stats
+from app.services.rate_limiter import stats as rate_limit_stats
+from app.services.redis_managers import get_client_manager, get_redis_router, get_room_hub
+from app.services.redis_router import RedisRouter
+from app.services.room_hub import RoomHub
+from app.services.db_managers import DBManagerInterface, get_db_manager
 from app.db.connection import get_db_session
-from app.db.models import Drawing
 
 router = APIRouter()
 
+STREAM_ID_PATTERN = r"^\d+-\d+$"
+# Stream entry id the snapshot and chunks are known to cover; clients
+# connect with it as last_seq to replay the events not flushed yet
+STREAM_SEQ_HEADER = "X-Stream-Seq"
+
+
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@router.get("/metrics")
+async def metrics():
+    return {
+        "compression": compression_stats.snapshot(),
+        "rate_limit": rate_limit_stats.snapshot(),
+    }
+
 
 @router.get("/{room_id}")
 async def get_drawings(
     room_id: UUID,
-    session: AsyncSession = Depends(get_db_session)
+    after_seq: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    db_manager: DBManagerInterface = Depends(get_db_manager)
 ):
-    result = await session.execute(select(Drawing).where(Drawing.room_id == room_id))
-    drawings = result.scalars()
-    return [{"x": drawing.x, "y": drawing.y, "prevX": drawing.prev_x, "prevY": drawing.prev_y} for drawing in drawings]
+    # Only chunks not yet compacted: compaction deletes the chunks it folds
+    # into the snapshot, so the full history is the snapshot followed by
+    # this endpoint from the snapshot's seq, not this endpoint from 0
+    return StreamingResponse(
+        db_manager.stream_drawings(room_id, after_seq, limit),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.get("/{room_id}/snapshot")
+async def get_snapshot(
+    room_id: UUID,
+    session: AsyncSession = Depends(get_db_session),
+    db_manager: DBManagerInterface = Depends(get_db_manager),
+    redis_router: RedisRouter = Depends(get_redis_router),
+    hub: RoomHub = Depends(get_room_hub)
+):
+    # Read before the database so later flushes can only widen the overlap
+    flushed_seq = await get_client_manager(room_id, redis_router, hub).get_flushed_seq()
+    snapshot = await db_manager.load_snapshot(room_id, session)
+    return Response(
+        content=snapshot,
+        media_type="application/octet-stream",
+        headers={STREAM_SEQ_HEADER: flushed_seq}
+    )
 
 
 @router.websocket("/{session_id}/user/{user_id}")
@@ -24,10 +75,11 @@ async def room_websocket_endpoint(
     websocket: WebSocket,
     session_id: UUID,
     user_id: UUID,
+    last_seq: Optional[str] = Query(None, pattern=STREAM_ID_PATTERN),
     session_factory: RoomWebSocketSessionFactory = Depends(
         RoomWebSocketSessionFactory)
 ):
-    session = session_factory.create_session(str(session_id), str(user_id), websocket)
+    session = session_factory.create_session(str(session_id), str(user_id), websocket, last_seq)
 
     try:
         await session.run()
@@ -39,3 +91,31 @@ async def room_websocket_endpoint(
         )
     finally:
         await session.handle_disconnection()
+
+
+@router.websocket("/mux")
+async def mux_websocket_endpoint(
+    websocket: WebSocket,
+    session_factory: MuxSessionFactory = Depends(MuxSessionFactory)
+):
+    async def open_channel(path: str, channel: VirtualWebSocket):
+        # Channels carry the same path a direct socket would:
+        # {session_id}/user/{user_id}[?last_seq=...]
+        url = urlsplit(path)
+        session_id, marker, user_id = url.path.strip("/").split("/")
+        if marker != "user":
+            raise ValueError(f"Unknown channel path: {path}")
+        last_seq = parse_qs(url.query).get("last_seq", [None])[0]
+        if last_seq is not None and not re.fullmatch(STREAM_ID_PATTERN, last_seq):
+            raise ValueError(f"Invalid last_seq: {last_seq}")
+        session = session_factory.create_session(UUID(session_id), UUID(user_id), channel, last_seq)
+
+        try:
+            await session.run()
+        except Exception:
+            await session.close_websocket(code=status.WS_1011_INTERNAL_ERROR)
+            raise
+        finally:
+            await session.handle_disconnection()
+
+    await MuxConnection(websocket, open_channel).run()
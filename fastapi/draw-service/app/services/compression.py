@@ -0,0 +1,112 @@
+import time
+from websockets import frames
+from websockets.extensions.permessage_deflate import (
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from app.config import settings
+
+
+class CompressionStats:
+    # Process-wide counters for every deflate-enabled socket
+    def __init__(self):
+        self.compressed_frames = 0
+        self.skipped_frames = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_seconds = 0.0
+        self.inflated_frames = 0
+        self.inflated_bytes = 0
+        self.inflate_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "compressed_frames": self.compressed_frames,
+            "skipped_frames": self.skipped_frames,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": self.compressed_bytes,
+            "compression_ratio": self.compressed_bytes / self.raw_bytes if self.raw_bytes else None,
+            "compress_seconds": self.compress_seconds,
+            "inflated_frames": self.inflated_frames,
+            "inflated_bytes": self.inflated_bytes,
+            "inflate_seconds": self.inflate_seconds,
+        }
+
+
+stats = CompressionStats()
+
+
+class TunedPerMessageDeflate(PerMessageDeflate):
+    # Messages below min_size go out uncompressed (RSV1 unset), which the
+    # extension allows per message. The shared context is left untouched.
+    def __init__(self, *args, min_size: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+        self.encode_cont_data = False
+
+    @classmethod
+    def tune(cls, extension: PerMessageDeflate, min_size: int) -> "TunedPerMessageDeflate":
+        return cls(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            min_size=min_size,
+        )
+
+    def encode(self, frame: frames.Frame) -> frames.Frame:
+        if frame.opcode in frames.CTRL_OPCODES:
+            return frame
+        if frame.opcode is not frames.OP_CONT:
+            # The size of a fragmented message is unknown up front
+            self.encode_cont_data = not frame.fin or len(frame.data) >= self.min_size
+        if not self.encode_cont_data:
+            stats.skipped_frames += 1
+            return frame
+
+        started = time.perf_counter()
+        encoded = super().encode(frame)
+        stats.compress_seconds += time.perf_counter() - started
+        stats.compressed_frames += 1
+        stats.raw_bytes += len(frame.data)
+        stats.compressed_bytes += len(encoded.data)
+        return encoded
+
+    def decode(self, frame: frames.Frame, *, max_size: int | None = None) -> frames.Frame:
+        if frame.opcode in frames.CTRL_OPCODES:
+            return frame
+        if frame.opcode is frames.OP_CONT:
+            compressed = self.decode_cont_data
+        else:
+            compressed = frame.rsv1
+        if not compressed:
+            return super().decode(frame, max_size=max_size)
+
+        started = time.perf_counter()
+        decoded = super().decode(frame, max_size=max_size)
+        stats.inflate_seconds += time.perf_counter() - started
+        stats.inflated_frames += 1
+        stats.inflated_bytes += len(decoded.data)
+        return decoded
+
+
+def get_compress_settings() -> dict:
+    return {"level": settings.WS_DEFLATE_LEVEL, "memLevel": settings.WS_DEFLATE_MEM_LEVEL}
+
+
+class TunedServerDeflateFactory(ServerPerMessageDeflateFactory):
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, TunedPerMessageDeflate.tune(extension, settings.WS_DEFLATE_MIN_SIZE)
+
+
+def server_deflate_factory() -> TunedServerDeflateFactory:
+    no_context_takeover = not settings.WS_DEFLATE_CONTEXT_TAKEOVER
+    return TunedServerDeflateFactory(
+        server_no_context_takeover=no_context_takeover,
+        client_no_context_takeover=no_context_takeover,
+        server_max_window_bits=settings.WS_DEFLATE_WINDOW_BITS,
+        client_max_window_bits=settings.WS_DEFLATE_WINDOW_BITS,
+        compress_settings=get_compress_settings(),
+    )
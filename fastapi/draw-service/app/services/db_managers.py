@@ -1,34 +1,126 @@
+import json
 import logging
+import struct
 from uuid import UUID
+from typing import AsyncIterator, Optional
 from abc import ABC, abstractmethod
+from sqlalchemy import func, delete
+from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.models import Drawing
+from app.config import settings
+from app.db.connection import session_factory
+from app.db.models import DrawingChunk, DrawingSnapshot
+from app.services.stroke_codec import SEGMENT, pack_points, unpack_points
+from app.services.stroke_simplifier import simplify_drawings, compact_points
 
 logger = logging.getLogger(__name__)
 
+# seq, segment count
+SNAPSHOT_HEADER = struct.Struct("<QI")
+
 
 class DBManagerInterface(ABC):
     @abstractmethod
     async def save_drawings(self, drawings: list[dict], session_id: UUID, db_session: AsyncSession):
         pass
 
+    @abstractmethod
+    def stream_drawings(self, room_id: UUID, after_seq: int, limit: Optional[int]) -> AsyncIterator[str]:
+        pass
+
+    @abstractmethod
+    async def compact_snapshot(self, room_id: UUID, db_session: AsyncSession, min_chunks: int):
+        pass
+
+    @abstractmethod
+    async def load_snapshot(self, room_id: UUID, db_session: AsyncSession) -> bytes:
+        pass
+
 
 class DBManager(DBManagerInterface):
+    COPY_COLUMNS = ("room_id", "seq", "segment_count", "points")
+    STREAM_YIELD_PER = 64
+
+    def __init__(
+        self,
+        use_copy: bool = True,
+        chunk_size: int = 4096,
+        simplify_tolerance: float = 0.0,
+        snapshot_growth: float = 0.5,
+        snapshot_tolerance: float = 0.0
+    ):
+        self.use_copy = use_copy
+        self.chunk_size = chunk_size
+        self.simplify_tolerance = simplify_tolerance
+        self.snapshot_growth = snapshot_growth
+        self.snapshot_tolerance = snapshot_tolerance
+
+    async def next_seq(self, room_id: UUID, db_session: AsyncSession) -> int:
+        # Compaction deletes folded chunks, so the snapshot may hold the highest seq
+        chunk_seq = (
+            select(func.max(DrawingChunk.seq))
+            .where(DrawingChunk.room_id == room_id)
+            .scalar_subquery()
+        )
+        snapshot_seq = (
+            select(DrawingSnapshot.seq)
+            .where(DrawingSnapshot.room_id == room_id)
+            .scalar_subquery()
+        )
+        result = await db_session.execute(
+            select(func.greatest(func.coalesce(chunk_seq, 0), func.coalesce(snapshot_seq, 0)))
+        )
+        return result.scalar_one() + 1
+
+    def build_chunks(self, drawings: list[dict], room_id: UUID, start_seq: int) -> list[tuple]:
+        chunks = []
+        for offset in range(0, len(drawings), self.chunk_size):
+            segments = drawings[offset:offset + self.chunk_size]
+            chunks.append((room_id, start_seq + len(chunks), len(segments), pack_points(segments)))
+        return chunks
+
     async def save_drawings(self, drawings: list[dict], session_id: UUID, db_session: AsyncSession):
-        insert_values = [
-            {
-                "room_id": session_id,
-                "x": drawing_data["x"],
-                "y": drawing_data["y"],
-                "prev_x": drawing_data["prevX"],
-                "prev_y": drawing_data["prevY"]
-            }
-            for drawing_data in drawings
-        ]
+        if not drawings:
+            return
+
+        # Only the stored copy is simplified; live fan-out stays lossless
+        if self.simplify_tolerance > 0:
+            drawings = simplify_drawings(drawings, self.simplify_tolerance)
+
+        room_id = UUID(str(session_id))
+        start_seq = await self.next_seq(room_id, db_session)
+        chunks = self.build_chunks(drawings, room_id, start_seq)
+
+        if self.use_copy:
+            try:
+                # A failed COPY only rolls back to the savepoint, keeping
+                # whatever the caller already did in this transaction
+                async with db_session.begin_nested():
+                    await self.copy_chunks(chunks, db_session)
+            except Exception as e:
+                logger.warning(f"COPY ingest failed, falling back to INSERT: {e}")
+            else:
+                await db_session.commit()
+                return
+
+        await self.insert_chunks(chunks, db_session)
+
+    async def copy_chunks(self, chunks: list[tuple], db_session: AsyncSession):
+        # Stream the batch through asyncpg's binary COPY instead of executemany
+        connection = await db_session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            DrawingChunk.__tablename__,
+            records=chunks,
+            columns=self.COPY_COLUMNS
+        )
+
+    async def insert_chunks(self, chunks: list[tuple], db_session: AsyncSession):
+        insert_values = [dict(zip(self.COPY_COLUMNS, chunk)) for chunk in chunks]
 
         try:
             await db_session.execute(
-                Drawing.__table__.insert(),
+                DrawingChunk.__table__.insert(),
                 insert_values
             )
             await db_session.commit()
@@ -36,6 +128,84 @@ class DBManager(DBManagerInterface):
             logger.error(f"Error saving draw data to DB: {e}")
             raise
 
+    async def stream_drawings(self, room_id: UUID, after_seq: int, limit: Optional[int]) -> AsyncIterator[str]:
+        query = (
+            select(DrawingChunk)
+            .where(DrawingChunk.room_id == room_id, DrawingChunk.seq > after_seq)
+            .order_by(DrawingChunk.seq)
+            .execution_options(yield_per=self.STREAM_YIELD_PER)
+        )
+        if limit:
+            query = query.limit(limit)
+
+        # The response outlives request dependencies, so the stream owns its session
+        async with session_factory() as db_session:
+            chunks = await db_session.stream_scalars(query)
+            async for chunk in chunks:
+                segments = [
+                    [segment["x"], segment["y"], segment["prevX"], segment["prevY"]]
+                    for segment in unpack_points(chunk.points)
+                ]
+                yield json.dumps({"seq": chunk.seq, "segments": segments}) + "\n"
+
+    async def compact_snapshot(self, room_id: UUID, db_session: AsyncSession, min_chunks: int):
+        room_id = UUID(str(room_id))
+        snapshot = await db_session.get(DrawingSnapshot, room_id)
+        covered_seq = snapshot.seq if snapshot else 0
+        covered_segments = snapshot.segment_count if snapshot else 0
+
+        tail_filter = (DrawingChunk.room_id == room_id, DrawingChunk.seq > covered_seq)
+        result = await db_session.execute(
+            select(func.count(), func.coalesce(func.sum(DrawingChunk.segment_count), 0))
+            .where(*tail_filter)
+        )
+        chunk_count, tail_segments = result.one()
+        # Each compaction rewrites the whole snapshot, so it waits for the tail
+        # to grow to a share of it; the bytes rewritten stay linear in history
+        if chunk_count < min_chunks or tail_segments < covered_segments * self.snapshot_growth:
+            return
+
+        result = await db_session.execute(
+            select(DrawingChunk).where(*tail_filter).order_by(DrawingChunk.seq))
+        chunks = result.scalars().all()
+        points = compact_points(
+            (snapshot.points if snapshot else b"") + b"".join(chunk.points for chunk in chunks),
+            self.snapshot_tolerance
+        )
+        segment_count = len(points) // SEGMENT.size
+
+        if snapshot:
+            snapshot.points = points
+            snapshot.segment_count = segment_count
+            snapshot.seq = chunks[-1].seq
+        else:
+            db_session.add(DrawingSnapshot(
+                room_id=room_id,
+                seq=chunks[-1].seq,
+                segment_count=segment_count,
+                points=points
+            ))
+
+        # Chunks folded just now stay for readers that fetched the previous
+        # snapshot; the ones it already covered are no longer read by anyone
+        await db_session.execute(
+            delete(DrawingChunk)
+            .where(DrawingChunk.room_id == room_id, DrawingChunk.seq <= covered_seq)
+        )
+        await db_session.commit()
+
+    async def load_snapshot(self, room_id: UUID, db_session: AsyncSession) -> bytes:
+        snapshot = await db_session.get(DrawingSnapshot, room_id)
+        if not snapshot:
+            return SNAPSHOT_HEADER.pack(0, 0)
+        return SNAPSHOT_HEADER.pack(snapshot.seq, snapshot.segment_count) + snapshot.points
+
 
 def get_db_manager() -> DBManagerInterface:
-    return DBManager()
+    return DBManager(
+        use_copy=settings.DRAW_COPY_INGEST,
+        chunk_size=settings.DRAW_CHUNK_SIZE,
+        simplify_tolerance=settings.DRAW_SIMPLIFY_TOLERANCE,
+        snapshot_growth=settings.DRAW_SNAPSHOT_GROWTH,
+        snapshot_tolerance=settings.DRAW_SNAPSHOT_TOLERANCE
+    )
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from fastapi import Depends
+from app.config import settings
+from app.services.redis_managers import DrawSessionInterface, RedisDrawSessionManager, get_redis_router, get_room_hub
+from app.services.redis_router import RedisRouter
+from app.services.room_hub import RoomHub
+from app.services.room_registry import RoomRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class DrawBatcher:
+    def __init__(self, session_id: str, draw_manager: DrawSessionInterface, tick: float, max_batch: int):
+        self.session_id = session_id
+        self.draw_manager = draw_manager
+        self.tick = tick
+        self.max_batch = max_batch
+        self.chunks: list[bytes] = []
+        self.flush_task: asyncio.Task | None = None
+
+    def add(self, frame: bytes):
+        self.chunks.append(frame)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_after_tick())
+
+    async def flush_after_tick(self):
+        await asyncio.sleep(self.tick)
+        await self.flush()
+
+    async def flush(self):
+        if not self.chunks:
+            return
+
+        # Binary stroke frames can be concatenated into a single frame, as
+        # long as it stays within the largest message sockets relay
+        batches = [[]]
+        size = 0
+        for chunk in self.chunks:
+            if batches[-1] and size + len(chunk) > self.max_batch:
+                batches.append([])
+                size = 0
+            batches[-1].append(chunk)
+            size += len(chunk)
+        self.chunks = []
+
+        for batch in batches:
+            try:
+                await self.draw_manager.save_draw_data(b"".join(batch))
+            except Exception as e:
+                logger.error(f"Error flushing draw batch for room {self.session_id}: {e}")
+
+    async def close(self):
+        if self.flush_task:
+            await self.flush_task
+        await self.flush()
+
+
+class DrawBatcherPool(RoomRegistry[DrawBatcher]):
+    _instance = None
+
+    def __init__(self, router: RedisRouter, hub: RoomHub, tick: float, max_batch: int):
+        super().__init__(
+            lambda session_id: DrawBatcher(
+                session_id,
+                RedisDrawSessionManager(session_id, router.get_client(session_id), hub),
+                tick,
+                max_batch
+            )
+        )
+
+    @classmethod
+    def get_instance(cls, router: RedisRouter, hub: RoomHub, tick: float, max_batch: int) -> "DrawBatcherPool":
+        if cls._instance is None:
+            cls._instance = cls(router, hub, tick, max_batch)
+        return cls._instance
+
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance:
+            await cls._instance.close()
+            cls._instance = None
+
+
+async def get_draw_batcher_pool(
+    router: RedisRouter = Depends(get_redis_router),
+    hub: RoomHub = Depends(get_room_hub)
+) -> DrawBatcherPool:
+    return DrawBatcherPool.get_instance(router, hub, settings.DRAW_TICK_MS / 1000, settings.WS_MAX_SIZE)
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from uuid import uuid4
+from fastapi import Depends
+from app.config import settings
+from app.db.connection import session_factory
+from app.services.db_managers import DBManagerInterface, get_db_manager
+from app.services.redis_managers import DrawSessionInterface, RedisDrawSessionManager, get_redis_router
+from app.services.redis_router import RedisRouter
+from app.services.room_registry import RoomRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class DrawFlusher:
+    # Only the holder of the room's flush lock drains it, whichever process that is
+    def __init__(
+        self,
+        session_id: str,
+        draw_manager: DrawSessionInterface,
+        db_manager: DBManagerInterface,
+        interval: float
+    ):
+        self.session_id = session_id
+        self.draw_manager = draw_manager
+        self.db_manager = db_manager
+        self.interval = interval
+        self.lock_ttl_ms = int(interval * 3 * 1000)
+        self.token = uuid4().hex
+        self.stopped = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while not self.stopped.is_set():
+            try:
+                await asyncio.wait_for(self.stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    async def flush(self):
+        try:
+            if not await self.draw_manager.acquire_flush_lock(self.token, self.lock_ttl_ms):
+                return
+            event_ids, drawings = await self.draw_manager.read_draw_events(
+                self.token, self.lock_ttl_ms, settings.DRAW_FLUSH_BATCH)
+        except Exception as e:
+            logger.error(f"Error reading draw events for room {self.session_id}: {e}")
+            return
+
+        if not event_ids:
+            return
+
+        # Unacknowledged events stay pending and are read again on the next flush
+        try:
+            if drawings:
+                async with session_factory() as db_session:
+                    await self.db_manager.save_drawings(drawings, self.session_id, db_session)
+            await self.draw_manager.ack_draw_events(event_ids)
+        except Exception as e:
+            logger.error(f"Error flushing draw data for room {self.session_id}: {e}")
+            return
+
+        if drawings:
+            await self.compact_snapshot()
+
+    async def compact_snapshot(self):
+        try:
+            async with session_factory() as db_session:
+                await self.db_manager.compact_snapshot(
+                    self.session_id, db_session, settings.DRAW_SNAPSHOT_CHUNKS)
+        except Exception as e:
+            logger.error(f"Error compacting snapshot for room {self.session_id}: {e}")
+
+    async def close(self):
+        self.stopped.set()
+        await self.task
+        await self.flush()
+        await self.draw_manager.release_flush_lock(self.token)
+
+
+class DrawFlusherPool(RoomRegistry[DrawFlusher]):
+    _instance = None
+
+    def __init__(self, router: RedisRouter, db_manager: DBManagerInterface, interval: float):
+        super().__init__(
+            lambda session_id: DrawFlusher(
+                session_id,
+                RedisDrawSessionManager(session_id, router.get_client(session_id)),
+                db_manager,
+                interval
+            )
+        )
+
+    @classmethod
+    def get_instance(
+        cls, router: RedisRouter, db_manager: DBManagerInterface, interval: float
+    ) -> "DrawFlusherPool":
+        if cls._instance is None:
+            cls._instance = cls(router, db_manager, interval)
+        return cls._instance
+
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance:
+            await cls._instance.close()
+            cls._instance = None
+
+
+async def get_draw_flusher_pool(
+    router: RedisRouter = Depends(get_redis_router),
+    db_manager: DBManagerInterface = Depends(get_db_manager)
+) -> DrawFlusherPool:
+    return DrawFlusherPool.get_instance(router, db_manager, settings.DRAW_FLUSH_INTERVAL)
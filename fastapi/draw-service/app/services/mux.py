@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import struct
+from typing import Awaitable, Callable
+from fastapi import WebSocket, status
+
+logger = logging.getLogger(__name__)
+
+# A gateway carries many client sockets over one upstream connection. Every
+# binary message on it starts with the channel id and an op code. Text and
+# binary messages toward the gateway spend a credit of the channel's window,
+# which the gateway returns with OP_CREDIT as the client reads them.
+MUX_SUBPROTOCOL = "quickdraw.mux.v1"
+
+MUX_HEADER = struct.Struct("<IB")
+CLOSE_CODE = struct.Struct("<H")
+CREDIT = struct.Struct("<I")
+
+OP_OPEN = 0x01
+OP_ACCEPT = 0x02
+OP_TEXT = 0x03
+OP_BINARY = 0x04
+OP_CLOSE = 0x05
+OP_CREDIT = 0x06
+
+
+def pack_frame(channel_id: int, op: int, payload: bytes = b"") -> bytes:
+    return MUX_HEADER.pack(channel_id, op) + payload
+
+
+class VirtualWebSocket:
+    # The part of starlette's WebSocket the room sessions use, backed by one channel
+    def __init__(
+        self, connection: "MuxConnection", channel_id: int, subprotocols: list[str], window: int | None
+    ):
+        self.connection = connection
+        self.channel_id = channel_id
+        self.scope = {"type": "websocket", "subprotocols": subprotocols}
+        self.client = connection.websocket.client
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        # None when the gateway does not do flow control
+        self.credits = window
+        self.credited = asyncio.Event()
+        self.closed = False
+
+    async def accept(self, subprotocol: str | None = None):
+        await self.connection.send(self.channel_id, OP_ACCEPT, (subprotocol or "").encode("utf-8"))
+
+    async def receive(self) -> dict:
+        return await self.incoming.get()
+
+    async def acquire_credit(self):
+        # Waiting here holds up the session's send loop, so a slow client's
+        # backlog builds in its SendQueue, which coalesces and resyncs it
+        if self.credits is None:
+            return
+        while self.credits <= 0 and not self.closed:
+            self.credited.clear()
+            await self.credited.wait()
+        self.credits -= 1
+
+    async def send_text(self, data: str):
+        await self.acquire_credit()
+        await self.connection.send(self.channel_id, OP_TEXT, data.encode("utf-8"))
+
+    async def send_bytes(self, data: bytes):
+        await self.acquire_credit()
+        await self.connection.send(self.channel_id, OP_BINARY, data)
+
+    async def close(self, code: int = status.WS_1000_NORMAL_CLOSURE):
+        if self.closed:
+            return
+        self.closed = True
+        self.credited.set()
+        try:
+            await self.connection.send(self.channel_id, OP_CLOSE, CLOSE_CODE.pack(code))
+        except Exception as e:
+            logger.debug(f"Could not close channel {self.channel_id}: {e}")
+
+    def feed(self, op: int, payload: bytes):
+        if op == OP_CREDIT:
+            if self.credits is not None and len(payload) == CREDIT.size:
+                self.credits += CREDIT.unpack(payload)[0]
+                self.credited.set()
+        elif op == OP_TEXT:
+            self.incoming.put_nowait({"type": "websocket.receive", "text": payload.decode("utf-8")})
+        elif op == OP_BINARY:
+            self.incoming.put_nowait({"type": "websocket.receive", "bytes": payload})
+
+    def disconnect(self, code: int):
+        self.closed = True
+        self.credited.set()
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": code})
+
+
+class MuxConnection:
+    # Demultiplexes one gateway link into virtual sockets, one task per channel
+    def __init__(
+        self,
+        websocket: WebSocket,
+        open_channel: Callable[[str, VirtualWebSocket], Awaitable[None]]
+    ):
+        self.websocket = websocket
+        self.open_channel = open_channel
+        self.channels: dict[int, VirtualWebSocket] = {}
+        self.tasks: set[asyncio.Task] = set()
+        self.send_lock = asyncio.Lock()
+
+    async def send(self, channel_id: int, op: int, payload: bytes = b""):
+        async with self.send_lock:
+            await self.websocket.send_bytes(pack_frame(channel_id, op, payload))
+
+    async def run(self):
+        await self.websocket.accept(subprotocol=MUX_SUBPROTOCOL)
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if frame is None or len(frame) < MUX_HEADER.size:
+                    continue
+                channel_id, op = MUX_HEADER.unpack_from(frame)
+                self.dispatch(channel_id, op, frame[MUX_HEADER.size:])
+        finally:
+            for channel in self.channels.values():
+                channel.disconnect(status.WS_1001_GOING_AWAY)
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def dispatch(self, channel_id: int, op: int, payload: bytes):
+        if op == OP_OPEN:
+            task = asyncio.create_task(self.run_channel(channel_id, payload))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            return
+
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return
+        if op == OP_CLOSE:
+            code = CLOSE_CODE.unpack(payload)[0] if len(payload) == CLOSE_CODE.size else status.WS_1000_NORMAL_CLOSURE
+            channel.disconnect(code)
+        else:
+            channel.feed(op, payload)
+
+    async def run_channel(self, channel_id: int, payload: bytes):
+        try:
+            request = json.loads(payload)
+            path = request["path"]
+        except (ValueError, KeyError):
+            await self.send(channel_id, OP_CLOSE, CLOSE_CODE.pack(status.WS_1008_POLICY_VIOLATION))
+            return
+
+        channel = VirtualWebSocket(self, channel_id, request.get("subprotocols") or [], request.get("window"))
+        self.channels[channel_id] = channel
+        try:
+            await self.open_channel(path, channel)
+        except Exception as e:
+            logger.error(f"Error on channel {channel_id} ({path}): {e}")
+            await channel.close(code=status.WS_1011_INTERNAL_ERROR)
+        finally:
+            self.channels.pop(channel_id, None)
+            await channel.close()
@@ -0,0 +1,146 @@
+import logging
+import time
+from cachetools import TTLCache
+from fastapi import Depends
+from redis.exceptions import RedisError
+from app.config import settings
+from app.services.redis_managers import get_redis_router
+from app.services.redis_router import RedisRouter
+
+logger = logging.getLogger(__name__)
+
+# Idle buckets refill completely long before this, so evicting them is harmless
+USER_BUCKET_TTL = 300
+
+
+class RateLimitStats:
+    def __init__(self):
+        self.rejected_draw = 0
+        self.rejected_chat = 0
+        self.rejected_global = 0
+        self.held_frames = 0
+        self.merged_frames = 0
+        self.dropped_frames = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "rejected_draw": self.rejected_draw,
+            "rejected_chat": self.rejected_chat,
+            "rejected_global": self.rejected_global,
+            "held_frames": self.held_frames,
+            "merged_frames": self.merged_frames,
+            "dropped_frames": self.dropped_frames,
+        }
+
+
+stats = RateLimitStats()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self) -> bool:
+        self.refill()
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def retry_after(self) -> float:
+        self.refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    # Every message spends a token from its connection's bucket and from the
+    # bucket shared by all of the user's connections on this instance. With
+    # RATE_LIMIT_GLOBAL_PER_SEC set, a per-second counter in Redis also caps
+    # the user across instances.
+    _instance = None
+
+    def __init__(self, router: RedisRouter, enabled: bool, user_rate: float, user_burst: int, global_limit: int):
+        self.router = router
+        self.enabled = enabled
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_limit = global_limit
+        self.user_buckets: TTLCache = TTLCache(maxsize=65536, ttl=USER_BUCKET_TTL)
+        # user -> second whose global budget is known to be spent
+        self.blocked_windows: TTLCache = TTLCache(maxsize=65536, ttl=2)
+
+    @classmethod
+    def get_instance(
+        cls, router: RedisRouter, enabled: bool, user_rate: float, user_burst: int, global_limit: int
+    ) -> "RateLimiter":
+        if cls._instance is None:
+            cls._instance = cls(router, enabled, user_rate, user_burst, global_limit)
+        return cls._instance
+
+    def get_user_bucket(self, user_id: str) -> TokenBucket:
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+        # Re-inserting keeps an active user's bucket from expiring
+        self.user_buckets[user_id] = bucket
+        return bucket
+
+    async def acquire(self, user_id: str, bucket: TokenBucket) -> bool:
+        if not self.enabled:
+            return True
+        user_bucket = self.get_user_bucket(user_id)
+        if not (bucket.ready() and user_bucket.ready()):
+            return False
+        bucket.take()
+        user_bucket.take()
+
+        if self.global_limit and not await self.acquire_global(user_id):
+            stats.rejected_global += 1
+            return False
+        return True
+
+    async def acquire_global(self, user_id: str) -> bool:
+        window = int(time.time())
+        if self.blocked_windows.get(user_id) == window:
+            return False
+
+        key = f"rate:{user_id}:{window}"
+        try:
+            async with self.router.get_client(user_id).pipeline(transaction=False) as pipe:
+                pipe.incr(key)
+                pipe.expire(key, 2)
+                count, _ = await pipe.execute()
+        except RedisError as e:
+            # Local buckets still apply; fail open rather than freeze the room
+            logger.error(f"Global rate limit check failed for {user_id}: {e}")
+            return True
+
+        if count > self.global_limit:
+            self.blocked_windows[user_id] = window
+            return False
+        return True
+
+    def retry_after(self, user_id: str, bucket: TokenBucket) -> float:
+        delay = max(bucket.retry_after(), self.get_user_bucket(user_id).retry_after())
+        now = time.time()
+        if self.blocked_windows.get(user_id) == int(now):
+            delay = max(delay, int(now) + 1 - now)
+        return delay
+
+
+async def get_rate_limiter(router: RedisRouter = Depends(get_redis_router)) -> RateLimiter:
+    return RateLimiter.get_instance(
+        router,
+        settings.RATE_LIMIT_ENABLED,
+        settings.RATE_LIMIT_USER_RATE,
+        settings.RATE_LIMIT_USER_BURST,
+        settings.RATE_LIMIT_GLOBAL_PER_SEC
+    )
@@ -1,11 +1,15 @@
 import logging
 import json
+import time
 from uuid import UUID
 from abc import ABC, abstractmethod
 from fastapi import Depends
 from redis import asyncio as aioredis
-from redis.asyncio import Redis
 from app.config import settings
+from app.services.room_hub import RoomHub, parse_stream_id
+from app.services.send_queue import RESYNC_MESSAGE
+from app.services.redis_router import RedisRouter
+from app.services.stroke_codec import is_binary_frame, encode_segments, decode_segments
 
 logger = logging.getLogger(__name__)
 
@@ -14,9 +18,9 @@ class RedisClient:
     _instance = None
 
     @classmethod
-    async def get_instance(cls):
+    async def get_instance(cls) -> RedisRouter:
         if cls._instance is None:
-            cls._instance = await Redis.from_url(f"redis://{settings.REDIS_HOST}:6379/0")
+            cls._instance = RedisRouter(settings.REDIS_NODES or [f"{settings.REDIS_HOST}:6379"])
         return cls._instance
 
     @classmethod
@@ -26,13 +30,23 @@ class RedisClient:
             cls._instance = None
 
 
-async def get_redis_pool():
+async def get_redis_router() -> RedisRouter:
     return await RedisClient.get_instance()
 
 
+async def get_room_hub() -> RoomHub:
+    return RoomHub.get_instance(
+        settings.SEND_QUEUE_MAX_BYTES, settings.SEND_QUEUE_MAX_DELAY, settings.WS_MAX_SIZE,
+        settings.PRESENCE_TIMEOUT)
+
+
 class ClientSessionInterface(ABC):
     @abstractmethod
-    async def add_client(self, client: str):
+    async def admit_client(self, client: str, capacity: int) -> int | None:
+        pass
+
+    @abstractmethod
+    async def refresh_client(self, client: str):
         pass
 
     @abstractmethod
@@ -44,11 +58,19 @@ class ClientSessionInterface(ABC):
         pass
 
     @abstractmethod
-    async def publish_client(self, data: str):
+    async def publish_client(self, data: str | bytes):
+        pass
+
+    @abstractmethod
+    async def listen(self, after_seq: str | None = None):
+        pass
+
+    @abstractmethod
+    async def get_tail_seq(self) -> str:
         pass
 
     @abstractmethod
-    async def listen(self):
+    async def get_flushed_seq(self) -> str:
         pass
 
     @abstractmethod
@@ -62,77 +84,352 @@ class DrawSessionInterface(ABC):
         pass
 
     @abstractmethod
-    async def save_draw_data(self, draw_data: dict):
+    async def save_draw_data(self, draw_data: dict | bytes):
         pass
 
     @abstractmethod
-    async def get_all_draw_data(self):
+    async def read_draw_events(self, consumer: str, min_idle_ms: int, count: int) -> tuple[list, list[dict]]:
         pass
 
     @abstractmethod
-    async def clear_draw_data(self):
+    async def ack_draw_events(self, event_ids: list):
         pass
 
+    @abstractmethod
+    async def acquire_flush_lock(self, token: str, ttl_ms: int) -> bool:
+        pass
 
-class RedisClientSessionManager(ClientSessionInterface):
-    def __init__(self, session_id, redis: aioredis.Redis):
-        self.redis = redis
-        self.pubsub = self.redis.pubsub()
-        self.client_key = f"{session_id}:clients"
+    @abstractmethod
+    async def release_flush_lock(self, token: str):
+        pass
 
-    async def session_exists(self) -> bool:
-        return await self.redis.exists(self.client_key) > 0
 
-    async def listen(self):
-        await self.pubsub.subscribe(self.client_key)
-        async for message in self.pubsub.listen():
-            yield message
+# Draw batches and chat messages of a room share one capped stream; the
+# entry kind tells the persistence consumer which ones to store.
+EVENT_DRAW = "draw"
+EVENT_CHAT = "chat"
+FLUSH_GROUP = "flushers"
+# Resume point that replays whatever the stream still holds
+STREAM_START = "0-0"
+
+
+def get_event_stream_key(session_id) -> str:
+    return f"{session_id}:events"
+
+
+def get_origins_key(session_id) -> str:
+    return f"{session_id}:origins"
+
+
+async def append_event(
+    redis: aioredis.Redis, stream_key: str, kind: str, data: str | bytes, hub: RoomHub | None = None
+):
+    fields = {"k": kind, "d": data}
+    if hub is not None:
+        fields["o"] = hub.origin
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.xadd(stream_key, fields, maxlen=settings.DRAW_STREAM_MAXLEN, approximate=True)
+        pipe.expire(stream_key, settings.DRAW_STREAM_TTL)
+        entry_id, _ = await pipe.execute()
+
+    # Sockets on this process get the event right away; the hub's stream
+    # reader skips it and only relays events appended by other processes.
+    if hub is not None:
+        hub.deliver_local(stream_key, data if isinstance(data, bytes) else data.encode("utf-8"), entry_id)
+
+
+# Presence is a sorted set of connections, "user_id:connection_id", scored
+# by their last heartbeat in milliseconds; members older than the timeout are
+# pruned before counting. Capacity counts distinct users, so a user's second
+# tab or resumed socket joins a full room they are already in. Admission
+# prunes, checks capacity, joins and refreshes the key TTL in one round-trip,
+# so concurrent joins cannot all pass the check before any of them is
+# counted. It also records the admitting process in the room's origins, scored
+# the same way, which tells room hubs whether anyone else appends to the room.
+# Returns the number of users, or -1 when the room is full.
+ADMIT_CLIENT_SCRIPT = """
+local now = tonumber(ARGV[3])
+local timeout = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - timeout)
+local users = {}
+local count = 0
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    local user = string.match(member, '^[^:]*')
+    if not users[user] then
+        users[user] = true
+        count = count + 1
+    end
+end
+local user = string.match(ARGV[1], '^[^:]*')
+if not users[user] then
+    if count >= tonumber(ARGV[2]) then
+        return -1
+    end
+    count = count + 1
+end
+redis.call('ZADD', KEYS[1], now, ARGV[1])
+redis.call('PEXPIRE', KEYS[1], timeout)
+redis.call('ZADD', KEYS[2], now, ARGV[5])
+redis.call('PEXPIRE', KEYS[2], timeout)
+return count
+"""
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
 
-    async def publish_client(self, data: str):
-        await self.redis.publish(self.client_key, data)
 
-    async def add_client(self, client: str):
-        await self.redis.sadd(self.client_key, client)
-        await self.redis.expire(self.client_key, 300)
+class RedisClientSessionManager(ClientSessionInterface):
+    def __init__(self, session_id, redis: aioredis.Redis, hub: RoomHub):
+        self.redis = redis
+        self.hub = hub
+        self.presence_key = f"{session_id}:presence"
+        self.origins_key = get_origins_key(session_id)
+        self.presence_timeout_ms = int(settings.PRESENCE_TIMEOUT * 1000)
+        self.stream_key = get_event_stream_key(session_id)
+        self.admit_client_script = self.redis.register_script(ADMIT_CLIENT_SCRIPT)
+
+    async def session_exists(self) -> bool:
+        return await self.redis.exists(self.presence_key) > 0
+
+    async def listen(self, after_seq: str | None = None):
+        # Subscribe before replaying so nothing falls between the two; live
+        # events the replay already covered are skipped by entry id.
+        queue = await self.hub.subscribe(self.redis, self.stream_key, self.origins_key)
+        try:
+            last_seq = None
+            if after_seq is None:
+                # No data, just a cursor, so a client that drops before any
+                # draw event still has a point to resume from
+                yield b"", await self.get_tail_seq()
+            else:
+                last_seq = parse_stream_id(after_seq)
+                async for data, seq in self.replay_draw_events(after_seq):
+                    if seq is not None:
+                        last_seq = parse_stream_id(seq)
+                    yield data, seq
+
+            while True:
+                data, seq = await queue.get()
+                if last_seq is not None and seq is not None and parse_stream_id(seq) <= last_seq:
+                    continue
+                yield data, seq
+        finally:
+            await self.hub.unsubscribe(self.stream_key, queue)
+
+    async def read_events(self, after_seq: str, count: int) -> list:
+        return await self.redis.xrange(self.stream_key, min=f"({after_seq}", count=count)
+
+    async def stream_reaches(self, after_seq: str) -> bool:
+        # Whether nothing after after_seq has been trimmed away yet
+        if after_seq == STREAM_START:
+            return True
+        first = await self.redis.xrange(self.stream_key, count=1)
+        return bool(first) and parse_stream_id(first[0][0]) <= parse_stream_id(after_seq)
+
+    async def get_backlog(self, after_seq: str) -> list | None:
+        # None when the stream no longer reaches back to after_seq, or the gap
+        # is big enough that reloading the snapshot is cheaper.
+        if not await self.stream_reaches(after_seq):
+            return None
+        entries = await self.read_events(after_seq, settings.RESUME_MAX_EVENTS + 1)
+        if len(entries) > settings.RESUME_MAX_EVENTS:
+            return None
+        return entries
+
+    async def replay_draw_events(self, after_seq: str):
+        entries = await self.get_backlog(after_seq)
+        page_size = None
+        if entries is None:
+            # Reloading lands the client where storage ends; only worth it
+            # when it can resume from there
+            flushed_seq = await self.get_flushed_seq()
+            if (
+                parse_stream_id(flushed_seq) > parse_stream_id(after_seq)
+                and await self.get_backlog(flushed_seq) is not None
+            ):
+                yield RESYNC_MESSAGE, None
+                return
+
+            # A reload would land no closer, so the rest of the stream is sent
+            # in pages, from the cursor or from wherever the stream now starts
+            if not await self.stream_reaches(after_seq):
+                after_seq = STREAM_START
+            page_size = settings.RESUME_MAX_EVENTS
+            entries = await self.read_events(after_seq, page_size)
+
+        while True:
+            for entry_id, fields in entries:
+                if fields.get(b"k") == EVENT_DRAW.encode():
+                    yield fields[b"d"], entry_id
+            if page_size is None or len(entries) < page_size:
+                return
+            entries = await self.read_events(entries[-1][0].decode(), page_size)
+
+    async def get_tail_seq(self) -> str:
+        entries = await self.redis.xrevrange(self.stream_key, count=1)
+        if not entries:
+            return STREAM_START
+        return entries[0][0].decode()
+
+    async def get_flushed_seq(self) -> str:
+        # Newest stream entry the database is known to hold: the one before the
+        # flush group's oldest unacknowledged entry, or the last one it was
+        # handed when nothing is pending. Entries are acked only after commit.
+        try:
+            pending = await self.redis.xpending(self.stream_key, FLUSH_GROUP)
+            if pending["pending"]:
+                bound = f"({pending['min'].decode()}"
+            else:
+                bound = next(
+                    group["last-delivered-id"]
+                    for group in await self.redis.xinfo_groups(self.stream_key)
+                    if group["name"] == FLUSH_GROUP.encode()
+                )
+        except aioredis.ResponseError:
+            # No stream or no flusher yet: nothing of it has been stored
+            return STREAM_START
+
+        entries = await self.redis.xrevrange(self.stream_key, max=bound, count=1)
+        if not entries:
+            return STREAM_START
+        return entries[0][0].decode()
+
+    async def publish_client(self, data: str | bytes):
+        await append_event(self.redis, self.stream_key, EVENT_CHAT, data, self.hub)
+
+    async def admit_client(self, client: str, capacity: int) -> int | None:
+        count = await self.admit_client_script(
+            keys=[self.presence_key, self.origins_key],
+            args=[client, capacity, now_ms(), self.presence_timeout_ms, self.hub.origin]
+        )
+        return None if count < 0 else count
+
+    async def refresh_client(self, client: str):
+        # XX: a member pruned or removed meanwhile is not brought back by a late beat
+        now = now_ms()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(self.presence_key, {client: now}, xx=True)
+            pipe.pexpire(self.presence_key, self.presence_timeout_ms)
+            pipe.zadd(self.origins_key, {self.hub.origin: now})
+            pipe.pexpire(self.origins_key, self.presence_timeout_ms)
+            await pipe.execute()
 
     async def remove_client(self, client: str):
-        await self.redis.srem(self.client_key, client)
+        await self.redis.zrem(self.presence_key, client)
 
     async def get_client_count(self) -> int:
-        return await self.redis.scard(self.client_key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.presence_key, "-inf", now_ms() - self.presence_timeout_ms)
+            pipe.zcard(self.presence_key)
+            _, count = await pipe.execute()
+        return count
 
     async def delete_client_session(self):
-        await self.redis.delete(self.client_key)
+        await self.redis.delete(self.presence_key)
 
 
-class RedisDrawSessionManager(DrawSessionInterface):
-    def __init__(self, session_id, redis: aioredis.Redis):
-        self.redis = redis
-        self.draw_key = f"{session_id}:draws"
+ACQUIRE_LOCK_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
 
-    async def session_exists(self) -> bool:
-        return await self.redis.exists(self.draw_key) > 0
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
-    async def save_draw_data(self, draw_data: dict):
-        await self.redis.rpush(self.draw_key, json.dumps(draw_data))
 
-    async def get_all_draw_data(self):
-        drawings = await self.redis.lrange(self.draw_key, 0, -1)
-        return [json.loads(draw) for draw in drawings]
+class RedisDrawSessionManager(DrawSessionInterface):
+    def __init__(self, session_id, redis: aioredis.Redis, hub: RoomHub | None = None):
+        self.redis = redis
+        self.hub = hub
+        self.stream_key = get_event_stream_key(session_id)
+        self.lock_key = f"{session_id}:flush_lock"
+        self.group_created = False
+        self.acquire_lock_script = self.redis.register_script(ACQUIRE_LOCK_SCRIPT)
+        self.release_lock_script = self.redis.register_script(RELEASE_LOCK_SCRIPT)
 
-    async def clear_draw_data(self):
-        await self.redis.delete(self.draw_key)
+    async def session_exists(self) -> bool:
+        return await self.redis.exists(self.stream_key) > 0
+
+    async def save_draw_data(self, draw_data: dict | bytes):
+        if not isinstance(draw_data, bytes):
+            draw_data = encode_segments([draw_data])
+        await append_event(self.redis, self.stream_key, EVENT_DRAW, draw_data, self.hub)
+
+    async def ensure_flush_group(self):
+        if self.group_created:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream_key, FLUSH_GROUP, id="0", mkstream=True)
+        except aioredis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self.group_created = True
+
+    async def read_draw_events(self, consumer: str, min_idle_ms: int, count: int) -> tuple[list, list[dict]]:
+        await self.ensure_flush_group()
+
+        # Take over entries left pending by a flusher that went away, then
+        # read our own unacknowledged entries before any new ones.
+        await self.redis.xautoclaim(
+            self.stream_key, FLUSH_GROUP, consumer, min_idle_ms, start_id="0-0", count=count)
+        entries = []
+        for start_id in ("0", ">"):
+            response = await self.redis.xreadgroup(
+                FLUSH_GROUP, consumer, {self.stream_key: start_id}, count=count)
+            for _, stream_entries in response:
+                entries.extend(stream_entries)
+
+        event_ids = []
+        draw_data = []
+        for event_id, fields in entries:
+            event_ids.append(event_id)
+            if not fields or fields.get(b"k") != EVENT_DRAW.encode():
+                continue
+            draw = fields[b"d"]
+            # Entries that cannot be decoded are still acked with the rest;
+            # left pending they would be handed back on every flush.
+            try:
+                if is_binary_frame(draw):
+                    draw_data.extend(decode_segments(draw))
+                else:
+                    draw_data.append(json.loads(draw))
+            except ValueError as e:
+                logger.error(f"Skipped undecodable draw event {event_id} in {self.stream_key}: {e}")
+        return event_ids, draw_data
+
+    async def ack_draw_events(self, event_ids: list):
+        if event_ids:
+            await self.redis.xack(self.stream_key, FLUSH_GROUP, *event_ids)
+
+    async def acquire_flush_lock(self, token: str, ttl_ms: int) -> bool:
+        return bool(await self.acquire_lock_script(keys=[self.lock_key], args=[token, ttl_ms]))
+
+    async def release_flush_lock(self, token: str):
+        await self.release_lock_script(keys=[self.lock_key], args=[token])
 
 
 def get_client_manager(
     session_id: UUID,
-    redis: aioredis.Redis = Depends(get_redis_pool)
+    router: RedisRouter = Depends(get_redis_router),
+    hub: RoomHub = Depends(get_room_hub)
 ) -> ClientSessionInterface:
-    return RedisClientSessionManager(session_id, redis)
+    return RedisClientSessionManager(session_id, router.get_client(session_id), hub)
 
 
 def get_draw_manager(
     session_id: UUID,
-    redis: aioredis.Redis = Depends(get_redis_pool)
+    router: RedisRouter = Depends(get_redis_router),
+    hub: RoomHub = Depends(get_room_hub)
 ) -> DrawSessionInterface:
-    return RedisDrawSessionManager(session_id, redis)
+    return RedisDrawSessionManager(session_id, router.get_client(session_id), hub)
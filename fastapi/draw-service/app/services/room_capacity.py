@@ -0,0 +1,30 @@
+import logging
+import httpx
+from cachetools import TTLCache
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+API_GATEWAY_URL = settings.API_GATEWAY_URL
+
+# max_players rarely changes after a room is created, so joins only pay for
+# the lookup once per room and TTL window.
+capacity_cache: TTLCache = TTLCache(maxsize=4096, ttl=settings.ROOM_CAPACITY_TTL)
+
+
+async def get_room_capacity(room_id: str) -> int:
+    capacity = capacity_cache.get(room_id)
+    if capacity is not None:
+        return capacity
+
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"{API_GATEWAY_URL}/api/v1/room/{room_id}")
+            response.raise_for_status()
+            capacity = int(response.json()["max_players"])
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        logger.error(f"Failed to fetch capacity of room {room_id}: {e}")
+        return settings.ROOM_DEFAULT_MAX_PLAYERS
+
+    capacity_cache[room_id] = capacity
+    return capacity
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from uuid import uuid4
+from redis.asyncio import Redis
+from app.services.send_queue import SendQueue
+
+logger = logging.getLogger(__name__)
+
+BLOCK_MS = 5000
+# How often an idle reader checks whether another process writes to its room
+ORIGIN_CHECK_INTERVAL = 1.0
+
+
+def parse_stream_id(entry_id: str | bytes) -> tuple[int, int]:
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    milliseconds, _, sequence = entry_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class RoomHub:
+    # One stream reader per room for the whole process, fanned out locally
+    _instance = None
+
+    def __init__(self, max_bytes: int, max_delay: float, max_frame: int, origin_timeout: float):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.max_frame = max_frame
+        self.origin_timeout_ms = int(origin_timeout * 1000)
+        # Tags the events this process appends so its own reader can skip them
+        self.origin = uuid4().hex.encode()
+        self.rooms: dict[str, set[SendQueue]] = {}
+        self.readers: dict[str, asyncio.Task] = {}
+        # Last entry this process appended to each room it has subscribers in
+        self.appended: dict[str, bytes] = {}
+
+    @classmethod
+    def get_instance(cls, max_bytes: int, max_delay: float, max_frame: int, origin_timeout: float) -> "RoomHub":
+        if cls._instance is None:
+            cls._instance = cls(max_bytes, max_delay, max_frame, origin_timeout)
+        return cls._instance
+
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance:
+            await cls._instance.close()
+            cls._instance = None
+
+    async def subscribe(self, redis: Redis, stream_key: str, origins_key: str) -> SendQueue:
+        # Never blocks the reader: a socket that falls too far behind is told to resync
+        queue = SendQueue(self.max_bytes, self.max_delay, self.max_frame)
+        subscribers = self.rooms.get(stream_key)
+        if subscribers is None:
+            subscribers = self.rooms[stream_key] = set()
+            self.readers[stream_key] = asyncio.create_task(self.read(redis, stream_key, origins_key))
+            logger.info(f"Started reading room stream {stream_key}")
+        subscribers.add(queue)
+        return queue
+
+    async def unsubscribe(self, stream_key: str, queue: SendQueue):
+        subscribers = self.rooms.get(stream_key)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if subscribers:
+            return
+
+        del self.rooms[stream_key]
+        self.appended.pop(stream_key, None)
+        reader = self.readers.pop(stream_key)
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        logger.info(f"Stopped reading room stream {stream_key}")
+
+    async def read(self, redis: Redis, stream_key: str, origins_key: str):
+        # The stream lives on whichever node the room is routed to
+        last_id = None
+        reading = False
+        while True:
+            try:
+                if last_id is None:
+                    # Start from the current tail so nothing appended while we wait is skipped
+                    last_entries = await redis.xrevrange(stream_key, count=1)
+                    last_id = last_entries[0][0] if last_entries else "0-0"
+                if not reading:
+                    # Local sockets got this process's own events from deliver_local(),
+                    # so the stream is only read while another process writes to the
+                    # room. Origins register on admission, before they can append, so
+                    # everything after our last append seen before a check that found
+                    # none is ours; reading resumes from there once one shows up.
+                    appended_id = self.appended.get(stream_key)
+                    if not await self.has_other_origins(redis, origins_key):
+                        if appended_id is not None and parse_stream_id(appended_id) > parse_stream_id(last_id):
+                            last_id = appended_id
+                        await asyncio.sleep(ORIGIN_CHECK_INTERVAL)
+                        continue
+                    reading = True
+                response = await redis.xread({stream_key: last_id}, block=BLOCK_MS)
+                # A block that times out is when to check whether to keep reading
+                reading = bool(response)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading room stream {stream_key}: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for _, entries in response:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    data = fields.get(b"d")
+                    if data is None or fields.get(b"o") == self.origin:
+                        continue
+                    self.deliver(stream_key, data, entry_id)
+
+    async def has_other_origins(self, redis: Redis, origins_key: str) -> bool:
+        now = int(time.time() * 1000)
+        origins = await redis.zrangebyscore(origins_key, now - self.origin_timeout_ms, "+inf")
+        return any(origin != self.origin for origin in origins)
+
+    def deliver_local(self, stream_key: str, data: bytes, seq: bytes):
+        if stream_key in self.rooms:
+            self.appended[stream_key] = seq
+        self.deliver(stream_key, data, seq)
+
+    def deliver(self, stream_key: str, data: bytes, seq: bytes):
+        for queue in self.rooms.get(stream_key, ()):
+            queue.put_nowait(data, seq)
+
+    async def close(self):
+        readers = list(self.readers.values())
+        self.readers.clear()
+        self.rooms.clear()
+        self.appended.clear()
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
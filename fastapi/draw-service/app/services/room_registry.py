@@ -0,0 +1,36 @@
+from typing import Callable, Generic, TypeVar
+
+RoomWorker = TypeVar("RoomWorker")
+
+
+class RoomRegistry(Generic[RoomWorker]):
+    # Reference-counted per-room workers shared by all local sockets of a room
+    def __init__(self, factory: Callable[[str], RoomWorker]):
+        self.factory = factory
+        self.workers: dict[str, RoomWorker] = {}
+        self.ref_counts: dict[str, int] = {}
+
+    def acquire(self, session_id: str) -> RoomWorker:
+        worker = self.workers.get(session_id)
+        if worker is None:
+            worker = self.workers[session_id] = self.factory(session_id)
+        self.ref_counts[session_id] = self.ref_counts.get(session_id, 0) + 1
+        return worker
+
+    async def release(self, session_id: str):
+        if session_id not in self.ref_counts:
+            return
+        self.ref_counts[session_id] -= 1
+        if self.ref_counts[session_id] > 0:
+            return
+
+        del self.ref_counts[session_id]
+        worker = self.workers.pop(session_id)
+        await worker.close()
+
+    async def close(self):
+        workers = list(self.workers.values())
+        self.workers.clear()
+        self.ref_counts.clear()
+        for worker in workers:
+            await worker.close()
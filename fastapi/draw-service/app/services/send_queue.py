@@ -0,0 +1,68 @@
+import asyncio
+import json
+import time
+from collections import deque
+from app.services.stroke_codec import is_binary_frame
+
+# Sent in place of everything a slow client fell behind on; the client redraws
+# from the snapshot and the chunk tail, then reconnects with the stream id the
+# snapshot reports to replay what was not flushed yet.
+RESYNC_MESSAGE = json.dumps({"type": "resync"}).encode("utf-8")
+
+
+class SendQueue:
+    # Outbound buffer for one socket, bounded in both bytes and age
+    def __init__(self, max_bytes: int, max_delay: float, max_frame: int):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        # Merged entries go out as one WebSocket message, so they stay within
+        # the size the mux link accepts
+        self.max_frame = max_frame
+        # [enqueued_at, chunks, seq, size]; binary draw chunks pile up in one
+        # entry until sent, which then carries the stream id of the newest one
+        self.entries: deque[list] = deque()
+        self.size = 0
+        self.resyncs = 0
+        self.ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def put_nowait(self, data: bytes, seq: bytes | None = None):
+        now = time.monotonic()
+        if self.entries and (
+            self.size + len(data) > self.max_bytes
+            or now - self.entries[0][0] > self.max_delay
+        ):
+            self.resync(now)
+
+        last = self.entries[-1] if self.entries else None
+        if (
+            last is not None
+            and is_binary_frame(data)
+            and is_binary_frame(last[1][0])
+            and last[3] + len(data) <= self.max_frame
+        ):
+            last[1].append(data)
+            last[2] = seq
+            last[3] += len(data)
+        else:
+            self.entries.append([now, [data], seq, len(data)])
+        self.size += len(data)
+        self.ready.set()
+
+    def resync(self, now: float):
+        self.entries.clear()
+        self.entries.append([now, [RESYNC_MESSAGE], None, len(RESYNC_MESSAGE)])
+        self.size = len(RESYNC_MESSAGE)
+        self.resyncs += 1
+
+    async def get(self) -> tuple[bytes, bytes | None]:
+        while not self.entries:
+            self.ready.clear()
+            await self.ready.wait()
+
+        _, chunks, seq, _ = self.entries.popleft()
+        data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+        self.size -= len(data)
+        return data, seq
@@ -0,0 +1,99 @@
+import json
+import struct
+
+# Clients that offer this subprotocol exchange draw segments as packed binary
+# frames; everyone else keeps using JSON text frames.
+BINARY_SUBPROTOCOL = "quickdraw.v1.bin"
+
+DRAW_SEGMENTS = 0x01
+# Server -> client only: the room stream entry id of the frame's last event
+STREAM_SEQ = 0x02
+
+# type, stroke id, segment count
+HEADER = struct.Struct("<BHH")
+# x, y, prevX, prevY in 1/COORD_SCALE pixel units
+SEGMENT = struct.Struct("<hhhh")
+# stream entry id: milliseconds, sequence
+SEQ = struct.Struct("<QQ")
+COORD_SCALE = 4
+
+INT16_MIN = -32768
+INT16_MAX = 32767
+
+
+def quantize(value: float) -> int:
+    return max(INT16_MIN, min(INT16_MAX, round(value * COORD_SCALE)))
+
+
+def is_binary_frame(data: bytes) -> bool:
+    return data[:1] == bytes([DRAW_SEGMENTS])
+
+
+def is_valid_stroke_frame(data: bytes) -> bool:
+    # Every chunk must be a segments chunk whose header count matches its
+    # payload exactly, so one bad frame cannot poison a room's batch.
+    offset = 0
+    while offset < len(data):
+        if offset + HEADER.size > len(data):
+            return False
+        frame_type, _, count = HEADER.unpack_from(data, offset)
+        if frame_type != DRAW_SEGMENTS:
+            return False
+        offset += HEADER.size + SEGMENT.size * count
+    return offset == len(data) and len(data) > 0
+
+
+def pack_points(segments: list[dict]) -> bytes:
+    points = bytearray(SEGMENT.size * len(segments))
+    for index, segment in enumerate(segments):
+        SEGMENT.pack_into(
+            points,
+            index * SEGMENT.size,
+            quantize(segment["x"]),
+            quantize(segment["y"]),
+            quantize(segment["prevX"]),
+            quantize(segment["prevY"])
+        )
+    return bytes(points)
+
+
+def unpack_points(points: bytes):
+    for x, y, prev_x, prev_y in SEGMENT.iter_unpack(points):
+        yield {
+            "x": x / COORD_SCALE,
+            "y": y / COORD_SCALE,
+            "prevX": prev_x / COORD_SCALE,
+            "prevY": prev_y / COORD_SCALE
+        }
+
+
+def encode_segments(segments: list[dict], stroke_id: int = 0) -> bytes:
+    header = HEADER.pack(DRAW_SEGMENTS, stroke_id & 0xFFFF, len(segments))
+    return header + pack_points(segments)
+
+
+def encode_seq(milliseconds: int, sequence: int) -> bytes:
+    return HEADER.pack(STREAM_SEQ, 0, 0) + SEQ.pack(milliseconds, sequence)
+
+
+def iter_segments(data: bytes):
+    # A frame may hold several chunks back to back, each with its own header.
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        frame_type, _, count = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        if frame_type != DRAW_SEGMENTS:
+            raise ValueError(f"Unknown stroke frame type: {frame_type}")
+        end = offset + SEGMENT.size * count
+        if end > len(data):
+            raise ValueError("Truncated stroke frame")
+        yield from unpack_points(data[offset:end])
+        offset = end
+
+
+def decode_segments(data: bytes) -> list[dict]:
+    return list(iter_segments(data))
+
+
+def to_json_frames(data: bytes) -> list[str]:
+    return [json.dumps({"type": "draw", **segment}) for segment in iter_segments(data)]
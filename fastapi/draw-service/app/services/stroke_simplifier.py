@@ -0,0 +1,69 @@
+import numpy as np
+from app.services.stroke_codec import pack_points, unpack_points
+
+
+def build_strokes(drawings: list[dict]) -> list[list[tuple[float, float]]]:
+    # Chain segments whose start point is the end point of an open stroke
+    strokes = []
+    open_strokes = {}
+    for drawing in drawings:
+        start = (drawing["prevX"], drawing["prevY"])
+        end = (drawing["x"], drawing["y"])
+        stroke = open_strokes.pop(start, None)
+        if stroke is None:
+            stroke = [start]
+            strokes.append(stroke)
+        stroke.append(end)
+        open_strokes[end] = stroke
+    return strokes
+
+
+def simplify_mask(points: np.ndarray, tolerance: float) -> np.ndarray:
+    # Ramer-Douglas-Peucker with the distances of each span computed in one pass
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+
+        direction = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(direction[0], direction[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            spans.append((start, split))
+            spans.append((split, end))
+    return keep
+
+
+def simplify_drawings(drawings: list[dict], tolerance: float) -> list[dict]:
+    simplified = []
+    for stroke in build_strokes(drawings):
+        points = np.asarray(stroke, dtype=np.float64)
+        if len(points) > 2:
+            points = points[simplify_mask(points, tolerance)]
+        simplified.extend(
+            {"x": float(x), "y": float(y), "prevX": float(prev_x), "prevY": float(prev_y)}
+            for (prev_x, prev_y), (x, y) in zip(points[:-1], points[1:])
+        )
+    return simplified
+
+
+def compact_points(points: bytes, tolerance: float) -> bytes:
+    # Segments drawn more than once are kept at their first occurrence, then
+    # strokes are simplified again now that chunk boundaries no longer split them
+    segments = np.frombuffer(points, dtype="<i2").reshape(-1, 4)
+    _, first = np.unique(segments, axis=0, return_index=True)
+    points = segments[np.sort(first)].tobytes()
+    if tolerance > 0:
+        points = pack_points(simplify_drawings(list(unpack_points(points)), tolerance))
+    return points
@@ -1,14 +1,19 @@
 import asyncio
 import logging
 import json
-from uuid import UUID
+from uuid import UUID, uuid4
 from abc import ABC, abstractmethod
 from fastapi import WebSocket, HTTPException, status, Depends
 from fastapi.websockets import WebSocketDisconnect
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.services.redis_managers import ClientSessionInterface, DrawSessionInterface, get_client_manager, get_draw_manager
-from app.services.db_managers import DBManagerInterface, get_db_manager
-from app.db.connection import get_db_session
+from app.config import settings
+from app.services.redis_managers import ClientSessionInterface, DrawSessionInterface, get_client_manager, get_draw_manager, get_redis_router, get_room_hub, parse_stream_id
+from app.services.redis_router import RedisRouter
+from app.services.room_hub import RoomHub
+from app.services.draw_batcher import DrawBatcherPool, get_draw_batcher_pool
+from app.services.draw_flusher import DrawFlusherPool, get_draw_flusher_pool
+from app.services.room_capacity import get_room_capacity
+from app.services.rate_limiter import RateLimiter, TokenBucket, get_rate_limiter, stats as rate_limit_stats
+from app.services.stroke_codec import BINARY_SUBPROTOCOL, is_binary_frame, is_valid_stroke_frame, encode_segments, encode_seq, to_json_frames
 
 logger = logging.getLogger(__name__)
 
@@ -21,24 +26,37 @@ class BaseWebSocketSession(ABC):
         websocket: WebSocket,
         client_manager: ClientSessionInterface,
         draw_manager: DrawSessionInterface,
-        db_manager: DBManagerInterface,
-        db_session: AsyncSession
+        batcher_pool: DrawBatcherPool,
+        flusher_pool: DrawFlusherPool,
+        rate_limiter: RateLimiter,
+        last_seq: str | None = None
     ):
         self.session_id = session_id
         self.user_id = user_id
+        # Presence is per connection, so a user's other sockets are not
+        # removed along with this one
+        self.presence_member = f"{user_id}:{uuid4().hex}"
         self.websocket = websocket
         self.client_manager = client_manager
         self.draw_manager = draw_manager
-        self.db_manager = db_manager
-        self.db_session = db_session
+        self.batcher_pool = batcher_pool
+        self.flusher_pool = flusher_pool
+        self.rate_limiter = rate_limiter
+        self.rate_bucket = TokenBucket(settings.RATE_LIMIT_CONNECTION_RATE, settings.RATE_LIMIT_CONNECTION_BURST)
+        # Draw frames received over budget, sent later as one merged frame
+        self.overflow: list[bytes] = []
+        self.overflow_size = 0
+        self.overflow_task: asyncio.Task | None = None
+        # Stream entry id of the last event a reconnecting client has seen
+        self.last_seq = last_seq
+        self.draw_batcher = None
+        self.draw_flusher = None
         self.is_closed = False
+        self.binary = False
 
     async def validate_session(self):
-        client_count = await self.client_manager.get_client_count()
-        if client_count is None:
-            await self.client_manager.add_client(self.user_id)
-            return
-        if client_count >= 8:
+        capacity = await get_room_capacity(self.session_id)
+        if await self.client_manager.admit_client(self.presence_member, capacity) is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Maximum connections per session exceeded."
@@ -53,8 +71,50 @@ class BaseWebSocketSession(ABC):
             await self.websocket.close(code=code)
             self.is_closed = True
 
+    async def allow_message(self) -> bool:
+        return await self.rate_limiter.acquire(self.user_id, self.rate_bucket)
+
+    async def add_draw_frame(self, frame: bytes):
+        # Frames queued behind held ones must wait their turn to keep strokes in order
+        if not self.overflow and await self.allow_message():
+            self.draw_batcher.add(frame)
+            return
+
+        rate_limit_stats.rejected_draw += 1
+        if self.overflow_size + len(frame) > settings.RATE_LIMIT_OVERFLOW_BYTES:
+            rate_limit_stats.dropped_frames += 1
+            return
+        self.overflow.append(frame)
+        self.overflow_size += len(frame)
+        rate_limit_stats.held_frames += 1
+        if self.overflow_task is None or self.overflow_task.done():
+            self.overflow_task = asyncio.create_task(self.release_overflow())
+
+    async def release_overflow(self):
+        while self.overflow:
+            await asyncio.sleep(self.rate_limiter.retry_after(self.user_id, self.rate_bucket))
+            if not await self.allow_message():
+                continue
+            # Binary stroke chunks concatenate into a single frame
+            frame = b"".join(self.overflow)
+            self.overflow = []
+            self.overflow_size = 0
+            if self.draw_batcher:
+                self.draw_batcher.add(frame)
+                rate_limit_stats.merged_frames += 1
+
     async def handle_disconnection(self):
-        await self.client_manager.remove_client(self.user_id)
+        if self.overflow_task:
+            self.overflow_task.cancel()
+            self.overflow_task = None
+        if self.draw_batcher:
+            self.draw_batcher = None
+            await self.batcher_pool.release(self.session_id)
+        if self.draw_flusher:
+            self.draw_flusher = None
+            await self.flusher_pool.release(self.session_id)
+
+        await self.client_manager.remove_client(self.presence_member)
         client_count = await self.client_manager.get_client_count()
         if client_count == 0:
             await self.client_manager.delete_client_session()
@@ -62,6 +122,14 @@ class BaseWebSocketSession(ABC):
         logger.info(f"Client {self.user_id} disconnected from session {
                     self.session_id}")
 
+    async def handle_heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                await self.client_manager.refresh_client(self.presence_member)
+            except Exception as e:
+                logger.error(f"Error refreshing presence of {self.user_id}: {e}")
+
     @abstractmethod
     async def handle_receive_messages(self):
         pass
@@ -70,47 +138,70 @@ class BaseWebSocketSession(ABC):
     async def handle_send_messages(self):
         pass
 
-    async def save_draw_data_to_db(self):
-        while not self.is_closed:
-            await asyncio.sleep(5)
-
-            if not await self.draw_manager.session_exists():
-                logger.info(
-                    f"Room {self.session_id} has been deleted. Stopping draw data save.")
-                break
-
-            drawings = await self.draw_manager.get_all_draw_data()
-            if drawings:
-                try:
-                    await self.db_manager.save_drawings(drawings, self.session_id, self.db_session)
-                finally:
-                    await self.draw_manager.clear_draw_data()
-
     async def run(self):
         await self.validate_session()
         await self.accept_connection()
 
         receive_task = asyncio.create_task(self.handle_receive_messages())
         send_task = asyncio.create_task(self.handle_send_messages())
-        save_task = asyncio.create_task(self.save_draw_data_to_db())
+        heartbeat_task = asyncio.create_task(self.handle_heartbeat())
+
+        try:
+            # Either side ending ends the session; a socket that can no longer
+            # send must not stay open receiving
+            done, _ = await asyncio.wait(
+                (receive_task, send_task), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (receive_task, send_task, heartbeat_task):
+                task.cancel()
+            await asyncio.gather(receive_task, send_task, heartbeat_task, return_exceptions=True)
 
-        await asyncio.gather(receive_task, send_task, save_task)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Session of {self.user_id} in room {self.session_id} failed: {task.exception()!r}")
+                # Lets the endpoint close the socket with 1011
+                raise task.exception()
 
 
 class RoomWebSocketSession(BaseWebSocketSession):
     async def accept_connection(self):
-        await self.websocket.accept()
-        await self.client_manager.add_client(self.user_id)
+        self.binary = BINARY_SUBPROTOCOL in self.websocket.scope.get("subprotocols", [])
+        await self.websocket.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
+        self.draw_batcher = self.batcher_pool.acquire(self.session_id)
+        self.draw_flusher = self.flusher_pool.acquire(self.session_id)
 
     async def handle_receive_messages(self):
         try:
             while True:
-                received_data = await self.websocket.receive_text()
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+
+                frame = message.get("bytes")
+                received_data = message.get("text")
+                # The server limit leaves room for the mux header; anything
+                # relayed must fit WS_MAX_SIZE to pass the gateway link
+                if len(frame if frame is not None else received_data.encode("utf-8")) > settings.WS_MAX_SIZE:
+                    logger.warning(f"Dropped oversized message from {self.user_id}")
+                    continue
+
+                if frame is not None:
+                    # Binary stroke frames are batched and relayed untouched
+                    if is_valid_stroke_frame(frame):
+                        await self.add_draw_frame(frame)
+                    else:
+                        logger.warning(f"Dropped malformed stroke frame from {self.user_id}")
+                    continue
+
                 data = json.loads(received_data)
 
                 if data.get("type") == "draw":
-                    await self.draw_manager.save_draw_data(data)
+                    await self.add_draw_frame(encode_segments([data]))
+                    continue
 
+                if not await self.allow_message():
+                    rate_limit_stats.rejected_chat += 1
+                    continue
                 await self.client_manager.publish_client(received_data)
 
         except WebSocketDisconnect:
@@ -120,10 +211,28 @@ class RoomWebSocketSession(BaseWebSocketSession):
 
     async def handle_send_messages(self):
         try:
-            async for message in self.client_manager.listen():
-                if message["type"] == "message" and not self.is_closed:
-                    data = message["data"]
+            async for data, seq in self.client_manager.listen(self.last_seq):
+                if self.is_closed:
+                    continue
+                if not data:
+                    if self.binary:
+                        await self.websocket.send_bytes(encode_seq(*parse_stream_id(seq)))
+                    continue
+                if not is_binary_frame(data):
                     await self.websocket.send_text(data.decode("utf-8"))
+                elif self.binary:
+                    # Binary clients track the seq to resume from after a reconnect
+                    if seq is not None:
+                        data += encode_seq(*parse_stream_id(seq))
+                    await self.websocket.send_bytes(data)
+                else:
+                    try:
+                        texts = to_json_frames(data)
+                    except ValueError as e:
+                        logger.error(f"Skipped undecodable draw batch in room {self.session_id}: {e}")
+                        continue
+                    for text in texts:
+                        await self.websocket.send_text(text)
 
         except WebSocketDisconnect:
             logger.info(f"Room WebSocket disconnected: {
@@ -136,16 +245,18 @@ class RoomWebSocketSessionFactory:
         self,
         client_manager: ClientSessionInterface = Depends(get_client_manager),
         draw_manager: DrawSessionInterface = Depends(get_draw_manager),
-        db_manager: DBManagerInterface = Depends(get_db_manager),
-        db_session: AsyncSession = Depends(get_db_session)
+        batcher_pool: DrawBatcherPool = Depends(get_draw_batcher_pool),
+        flusher_pool: DrawFlusherPool = Depends(get_draw_flusher_pool),
+        rate_limiter: RateLimiter = Depends(get_rate_limiter)
     ):
         self.client_manager = client_manager
         self.draw_manager = draw_manager
-        self.db_manager = db_manager
-        self.db_session = db_session
+        self.batcher_pool = batcher_pool
+        self.flusher_pool = flusher_pool
+        self.rate_limiter = rate_limiter
 
     def create_session(
-        self, session_id: str, user_id: str, websocket: WebSocket
+        self, session_id: str, user_id: str, websocket: WebSocket, last_seq: str | None = None
     ) -> RoomWebSocketSession:
         return RoomWebSocketSession(
             session_id,
@@ -153,6 +264,41 @@ class RoomWebSocketSessionFactory:
             websocket,
             self.client_manager,
             self.draw_manager,
-            self.db_manager,
-            self.db_session
+            self.batcher_pool,
+            self.flusher_pool,
+            self.rate_limiter,
+            last_seq
+        )
+
+
+class MuxSessionFactory:
+    # One multiplexed link carries sockets of many rooms, so the managers are
+    # built per channel instead of per request.
+    def __init__(
+        self,
+        redis_router: RedisRouter = Depends(get_redis_router),
+        hub: RoomHub = Depends(get_room_hub),
+        batcher_pool: DrawBatcherPool = Depends(get_draw_batcher_pool),
+        flusher_pool: DrawFlusherPool = Depends(get_draw_flusher_pool),
+        rate_limiter: RateLimiter = Depends(get_rate_limiter)
+    ):
+        self.redis_router = redis_router
+        self.hub = hub
+        self.batcher_pool = batcher_pool
+        self.flusher_pool = flusher_pool
+        self.rate_limiter = rate_limiter
+
+    def create_session(
+        self, session_id: UUID, user_id: UUID, websocket: WebSocket, last_seq: str | None = None
+    ) -> RoomWebSocketSession:
+        return RoomWebSocketSession(
+            str(session_id),
+            str(user_id),
+            websocket,
+            get_client_manager(session_id, self.redis_router, self.hub),
+            get_draw_manager(session_id, self.redis_router, self.hub),
+            self.batcher_pool,
+            self.flusher_pool,
+            self.rate_limiter,
+            last_seq
         )
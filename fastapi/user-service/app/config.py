@@ -8,6 +8,7 @@ class Settings(BaseSettings):
     BASE_URL: str
     USER_DB_URL: str
     REDIS_HOST: str
+    REDIS_NODES: list[str] = []
 
     class Config:
         env_file = ".env"
@@ -1,10 +1,10 @@
-import redis.asyncio as redis
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import exc
 from sqlmodel import SQLModel
 from app.config import settings
+from app.db.redis_router import RedisRouter
 
 
 database_connection_url = settings.USER_DB_URL.replace(
@@ -18,14 +18,10 @@ session_factory = sessionmaker(
     expire_on_commit=False
 )
 
-redis_client = redis.Redis(
-    host=settings.REDIS_HOST,
-    port=6379,
-    decode_responses=True 
-)
+redis_router = RedisRouter(settings.REDIS_NODES or [f"{settings.REDIS_HOST}:6379"])
 
-def get_redis_client():
-    return redis_client
+def get_redis_router():
+    return redis_router
 
 
 async def init_db(engine: AsyncEngine):
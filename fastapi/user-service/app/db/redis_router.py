@@ -0,0 +1,78 @@
+import bisect
+import hashlib
+from redis.asyncio import Redis
+
+VIRTUAL_NODES = 160
+
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    # Each node owns many points on the ring, so adding or removing one only
+    # moves the keys between it and its neighbours (about 1/n of them).
+    def __init__(self, nodes: list[str] = (), replicas: int = VIRTUAL_NODES):
+        self.replicas = replicas
+        self.points: list[int] = []
+        self.owners: dict[int, str] = {}
+        self.nodes: set[str] = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = hash_key(f"{node}#{replica}")
+            if point in self.owners:
+                continue
+            bisect.insort(self.points, point)
+            self.owners[point] = node
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for replica in range(self.replicas):
+            point = hash_key(f"{node}#{replica}")
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                self.points.pop(bisect.bisect_left(self.points, point))
+
+    def get(self, key: str) -> str:
+        if not self.points:
+            raise LookupError("Hash ring has no nodes")
+        index = bisect.bisect(self.points, hash_key(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+class RedisRouter:
+    # Cached entries live on the node their key hashes to
+    def __init__(self, nodes: list[str]):
+        self.ring = HashRing()
+        self.clients: dict[str, Redis] = {}
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node: str):
+        if node not in self.clients:
+            self.clients[node] = Redis.from_url(f"redis://{node}/0", decode_responses=True)
+            self.ring.add(node)
+
+    async def remove_node(self, node: str):
+        client = self.clients.pop(node, None)
+        if client is not None:
+            self.ring.remove(node)
+            await client.close()
+
+    def get_client(self, key) -> Redis:
+        return self.clients[self.ring.get(str(key))]
+
+    async def close(self):
+        clients = list(self.clients.values())
+        self.clients.clear()
+        self.ring = HashRing()
+        for client in clients:
+            await client.close()
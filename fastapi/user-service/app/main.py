@@ -1,7 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.db.connection import init_db, close_db, engine
+from app.db.connection import init_db, close_db, engine, redis_router
 from app.routes import user
 from app.config import settings
 
@@ -12,6 +12,7 @@ async def lifespan(app: FastAPI):
         await init_db(engine)
         yield
     finally:
+        await redis_router.close()
         await close_db(engine)
 
 app = FastAPI(
@@ -1,4 +1,3 @@
-from redis.asyncio import Redis
 from uuid import UUID, uuid4
 from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException, Depends
@@ -6,7 +5,8 @@ from passlib.hash import bcrypt
 from google.oauth2 import id_token
 from google.auth.transport import requests
 from app.auth.jwt import create_access_token
-from app.db.connection import get_redis_client
+from app.db.connection import get_redis_router
+from app.db.redis_router import RedisRouter
 from app.db.repositories import UserRepository
 from app.db.models import User
 from app.schemas.request import SignUpRequest, SignInRequest, LoginRequest
@@ -21,8 +21,9 @@ router = APIRouter(
 async def validate_user(
     user_id: UUID,
     user_repository: UserRepository = Depends(UserRepository),
-    redis: Redis = Depends(get_redis_client)
+    redis_router: RedisRouter = Depends(get_redis_router)
 ):
+    redis = redis_router.get_client(user_id)
     cached_result = await redis.get(f"user:{str(user_id)}")
     if cached_result:
         return {"message": "User is valid"}
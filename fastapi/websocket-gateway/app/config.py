@@ -4,6 +4,23 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     BASE_URL: str
     DRAW_SERVICE_URL: str
+    DRAW_SERVICE_URLS: list[str] = []
+    HEALTH_CHECK_INTERVAL: float = 5.0
+    HEALTH_CHECK_TIMEOUT: float = 2.0
+    HEALTH_CHECK_FAILURES: int = 2
+    MUX_ENABLED: bool = True
+    MUX_LINKS_PER_BACKEND: int = 4
+    # Messages draw-service may have in flight per channel before it waits for credit
+    MUX_CHANNEL_MAX_QUEUE: int = 256
+    WS_MAX_SIZE: int = 1048576
+    WS_MAX_QUEUE: int = 16
+    WS_WRITE_LIMIT: int = 32768
+    WS_DEFLATE_ENABLED: bool = True
+    WS_DEFLATE_LEVEL: int = 6
+    WS_DEFLATE_WINDOW_BITS: int = 12
+    WS_DEFLATE_MEM_LEVEL: int = 5
+    WS_DEFLATE_CONTEXT_TAKEOVER: bool = True
+    WS_DEFLATE_MIN_SIZE: int = 128
     TIME_OUT: float = 10.0
 
     class Config:
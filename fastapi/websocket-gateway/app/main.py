@@ -1,9 +1,23 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from app.routes import proxy
+from app.services.upstream_pool import UpstreamPools
 from app.config import settings
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        for backend_router in proxy.SERVICE_ROUTERS.values():
+            backend_router.start()
+        yield
+    finally:
+        for backend_router in proxy.SERVICE_ROUTERS.values():
+            await backend_router.close()
+        await UpstreamPools.close_instance()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://127.0.0.1:8000",
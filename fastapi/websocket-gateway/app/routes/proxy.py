@@ -1,51 +1,141 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
 import websockets
+from websockets.asyncio.client import connect
 import asyncio
 import logging
 from app.config import settings
+from app.services.backend_router import BackendRouter
+from app.services.upstream_pool import UpstreamPools, ChannelRefused
+from app.services.compression import client_deflate_factory, stats as compression_stats
 
 router = APIRouter()
 
-SERVICE_URLS = {
-    "draw": settings.DRAW_SERVICE_URL
+SERVICE_ROUTERS = {
+    "draw": BackendRouter(
+        settings.DRAW_SERVICE_URLS or [settings.DRAW_SERVICE_URL],
+        settings.HEALTH_CHECK_INTERVAL,
+        settings.HEALTH_CHECK_TIMEOUT,
+        settings.HEALTH_CHECK_FAILURES
+    )
 }
 
 logger = logging.getLogger(__name__)
 
 
+# Limits for the gateway -> service hop; uvicorn's --ws-max-size bounds the client hop
+CONNECT_OPTIONS = {
+    "max_size": settings.WS_MAX_SIZE,
+    "max_queue": settings.WS_MAX_QUEUE,
+    "write_limit": settings.WS_WRITE_LIMIT,
+    "open_timeout": settings.TIME_OUT,
+    # Tuned permessage-deflate instead of the library defaults
+    "compression": None,
+    "extensions": [client_deflate_factory()] if settings.WS_DEFLATE_ENABLED else [],
+}
+
+
+def get_close_code(e: websockets.ConnectionClosed) -> int:
+    # 1005/1006 only describe what was received and may not be sent on
+    if e.rcvd is None:
+        return 1011
+    if e.rcvd.code in (1005, 1006):
+        return 1000
+    return e.rcvd.code
+
+
+async def open_service_socket(service_url: str, path: str, subprotocols):
+    if settings.MUX_ENABLED:
+        # A channel on one of the pooled links to this backend
+        pools = UpstreamPools.get_instance(
+            settings.MUX_LINKS_PER_BACKEND, settings.TIME_OUT, CONNECT_OPTIONS, settings.MUX_CHANNEL_MAX_QUEUE)
+        pool = pools.get_pool(service_url.replace("http", "ws") + "/mux")
+        return await pool.open_channel(path, subprotocols)
+
+    service_ws_url = service_url.replace("http", "ws") + f"/{path}"
+    service_ws = await connect(service_ws_url, subprotocols=subprotocols, **CONNECT_OPTIONS)
+    logger.info(f"WebSocket connection established with {service_ws_url}")
+    return service_ws
+
+
+async def connect_service(backend_router: BackendRouter, room_id: str, path: str, subprotocols):
+    # Sockets of one room share a backend; fall over to the next one on the
+    # ring when it cannot be reached.
+    for _ in range(len(backend_router.backends)):
+        service_url = backend_router.get_backend(room_id)
+        try:
+            return await open_service_socket(service_url, path, subprotocols)
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.warning(f"Failed to connect to {service_url}: {e}")
+            backend_router.mark_down(service_url)
+    return None
+
+
+@router.get("/metrics")
+async def metrics():
+    return {"compression": compression_stats.snapshot()}
+
+
 @router.websocket("/ws/{service}/{path:path}")
 async def proxy_websocket(service: str, path: str, websocket: WebSocket):
-    service_url = SERVICE_URLS.get(service)
-    if not service_url:
+    backend_router = SERVICE_ROUTERS.get(service)
+    if not backend_router:
         await websocket.close(code=1008)
         logger.warning(f"Invalid service: {service}")
         return
 
-    service_ws_url = service_url.replace("http", "ws") + f"/{path}"
+    room_id = path.split("/", 1)[0]
+    subprotocols = websocket.scope.get("subprotocols") or None
+    # Resume cursors and other parameters ride along in the query string
+    if websocket.url.query:
+        path = f"{path}?{websocket.url.query}"
 
     try:
-        async with websockets.connect(service_ws_url) as service_ws:
-            await websocket.accept()
-            logger.info(f"WebSocket connection established with {service_ws_url}")
+        service_ws = await connect_service(backend_router, room_id, path, subprotocols)
+        if service_ws is None:
+            logger.error(f"No {service} backend available for room {room_id}")
+            await websocket.close(code=1011)
+            return
+
+        try:
+            await websocket.accept(subprotocol=service_ws.subprotocol)
 
             async def forward_to_service():
                 try:
-                    async for message in websocket.iter_text():
-                        await service_ws.send(message)
+                    while True:
+                        message = await websocket.receive()
+                        if message["type"] == "websocket.disconnect":
+                            raise WebSocketDisconnect(message.get("code", 1000))
+                        if message.get("bytes") is not None:
+                            await service_ws.send(message["bytes"])
+                        else:
+                            await service_ws.send(message["text"])
                 except WebSocketDisconnect:
                     logger.info("Client WebSocket disconnected")
                     await service_ws.close()
 
             async def forward_to_client():
+                # Binary frames go out as received. ASGI only takes str for
+                # text frames, so those are the one thing decoded here.
                 try:
-                    async for message in service_ws:
-                        await websocket.send_text(message)
-                except websockets.ConnectionClosed:
+                    while True:
+                        message = await service_ws.recv()
+                        if isinstance(message, bytes):
+                            await websocket.send_bytes(message)
+                        else:
+                            await websocket.send_text(message)
+                except websockets.ConnectionClosed as e:
                     logger.info("Service WebSocket disconnected")
-                    await websocket.close()
+                    if websocket.client_state == WebSocketState.CONNECTED:
+                        await websocket.close(code=get_close_code(e))
 
             await asyncio.gather(forward_to_service(), forward_to_client())
+        finally:
+            await service_ws.close()
 
+    except ChannelRefused as e:
+        logger.info(f"Service refused WebSocket for {path}: {e.code}")
+        await websocket.close(code=e.code)
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected by client")
     except websockets.ConnectionClosed:
@@ -55,6 +145,8 @@ async def proxy_websocket(service: str, path: str, websocket: WebSocket):
         await websocket.close(code=1011)
     finally:
         try:
-            await websocket.close()
+            if (websocket.client_state == WebSocketState.CONNECTED
+                    and websocket.application_state == WebSocketState.CONNECTED):
+                await websocket.close()
         except Exception as e:
             logger.error(f"Error while closing WebSocket: {e}", exc_info=True)
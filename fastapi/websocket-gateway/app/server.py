@@ -0,0 +1,23 @@
+import uvicorn
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from app.config import settings
+from app.services.compression import server_deflate_factory
+
+
+class TunedWebSocketProtocol(WebSocketProtocol):
+    # uvicorn only knows its default permessage-deflate settings; offer ours instead
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.available_extensions = [server_deflate_factory()] if settings.WS_DEFLATE_ENABLED else []
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        proxy_headers=True,
+        ws=TunedWebSocketProtocol,
+        ws_max_size=settings.WS_MAX_SIZE,
+        ws_max_queue=settings.WS_MAX_QUEUE
+    )
@@ -0,0 +1,110 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+VIRTUAL_NODES = 160
+
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    # Each node owns many points on the ring, so adding or removing one only
+    # moves the keys between it and its neighbours (about 1/n of them).
+    def __init__(self, nodes: list[str] = (), replicas: int = VIRTUAL_NODES):
+        self.replicas = replicas
+        self.points: list[int] = []
+        self.owners: dict[int, str] = {}
+        self.nodes: set[str] = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = hash_key(f"{node}#{replica}")
+            if point in self.owners:
+                continue
+            bisect.insort(self.points, point)
+            self.owners[point] = node
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for replica in range(self.replicas):
+            point = hash_key(f"{node}#{replica}")
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                self.points.pop(bisect.bisect_left(self.points, point))
+
+    def get(self, key: str) -> str:
+        if not self.points:
+            raise LookupError("Hash ring has no nodes")
+        index = bisect.bisect(self.points, hash_key(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+class BackendRouter:
+    # Pins every socket of a room to one backend. Only healthy backends are on
+    # the ring, so a dead one only gives up its own rooms.
+    def __init__(self, backends: list[str], interval: float, timeout: float, failures: int):
+        self.backends = backends
+        self.interval = interval
+        self.timeout = timeout
+        self.failures = failures
+        self.ring = HashRing(backends)
+        self.failure_counts: dict[str, int] = {backend: 0 for backend in backends}
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        if self.task is None and len(self.backends) > 1:
+            self.task = asyncio.create_task(self.run())
+
+    def get_backend(self, room_id: str) -> str:
+        return self.ring.get(room_id)
+
+    def mark_down(self, backend: str):
+        if backend in self.ring.nodes and len(self.ring.nodes) > 1:
+            self.ring.remove(backend)
+            logger.warning(f"Backend {backend} marked down")
+
+    def mark_up(self, backend: str):
+        if backend not in self.ring.nodes:
+            self.ring.add(backend)
+            logger.info(f"Backend {backend} marked up")
+
+    async def run(self):
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            while True:
+                await asyncio.gather(*(self.check(client, backend) for backend in self.backends))
+                await asyncio.sleep(self.interval)
+
+    async def check(self, client: httpx.AsyncClient, backend: str):
+        try:
+            response = await client.get(f"{backend}/health")
+            healthy = response.status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+
+        if healthy:
+            self.failure_counts[backend] = 0
+            self.mark_up(backend)
+            return
+
+        self.failure_counts[backend] += 1
+        if self.failure_counts[backend] >= self.failures:
+            self.mark_down(backend)
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
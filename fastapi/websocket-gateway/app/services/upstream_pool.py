@@ -0,0 +1,241 @@
+import asyncio
+import itertools
+import json
+import logging
+import struct
+import websockets
+from websockets.asyncio.client import connect
+from websockets.frames import Close
+
+logger = logging.getLogger(__name__)
+
+# Must match draw-service's app/services/mux.py
+MUX_SUBPROTOCOL = "quickdraw.mux.v1"
+
+MUX_HEADER = struct.Struct("<IB")
+CLOSE_CODE = struct.Struct("<H")
+# STREAM_SEQ chunk draw-service appends to binary frames for binary clients
+SEQ_TRAILER_SIZE = 21
+
+OP_OPEN = 0x01
+OP_ACCEPT = 0x02
+OP_TEXT = 0x03
+OP_BINARY = 0x04
+OP_CLOSE = 0x05
+OP_CREDIT = 0x06
+CREDIT = struct.Struct("<I")
+
+
+def pack_frame(channel_id: int, op: int, payload: bytes = b"") -> bytes:
+    return MUX_HEADER.pack(channel_id, op) + payload
+
+
+class ChannelRefused(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"Channel refused with code {code}")
+        self.code = code
+
+
+class Channel:
+    # Looks enough like a websockets connection for the proxy loops:
+    # send(), recv(), close() and subprotocol.
+    def __init__(self, link: "UpstreamLink", channel_id: int):
+        self.link = link
+        self.channel_id = channel_id
+        self.accepted: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Bounded by feed() rather than maxsize so the close marker always fits
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        # Messages taken off the queue since credit was last returned
+        self.consumed = 0
+        self.subprotocol = None
+        self.close_code = None
+
+    async def send(self, message: str | bytes):
+        if self.close_code is not None:
+            raise websockets.ConnectionClosedOK(None, None)
+        if isinstance(message, str):
+            await self.link.send(self.channel_id, OP_TEXT, message.encode("utf-8"))
+        else:
+            await self.link.send(self.channel_id, OP_BINARY, message)
+
+    async def close(self, code: int = 1000):
+        if self.close_code is not None:
+            return
+        self.closed(code)
+        try:
+            await self.link.send(self.channel_id, OP_CLOSE, CLOSE_CODE.pack(code))
+        except websockets.ConnectionClosed:
+            pass
+
+    def feed(self, message: str | bytes) -> bool:
+        if self.incoming.qsize() >= self.link.max_queue:
+            return False
+        self.incoming.put_nowait(message)
+        return True
+
+    def closed(self, code: int):
+        self.close_code = code
+        self.link.channels.pop(self.channel_id, None)
+        if not self.accepted.done():
+            self.accepted.set_exception(ChannelRefused(code))
+        self.incoming.put_nowait(None)
+
+    async def recv(self) -> str | bytes:
+        message = await self.incoming.get()
+        if message is None:
+            self.incoming.put_nowait(None)
+            raise websockets.ConnectionClosedOK(Close(self.close_code, ""), None)
+
+        # The proxy loop comes back for the next message only once the client
+        # took this one, so credit returns at the pace the client reads
+        self.consumed += 1
+        if self.consumed >= self.link.credit_batch:
+            credit = self.consumed
+            self.consumed = 0
+            try:
+                await self.link.send(self.channel_id, OP_CREDIT, CREDIT.pack(credit))
+            except websockets.ConnectionClosed:
+                pass
+        return message
+
+
+class UpstreamLink:
+    # One persistent socket to a backend carrying many channels. Each channel
+    # opens with max_queue messages of credit, which draw-service spends on
+    # every message it sends and the channel returns as the client reads.
+    def __init__(self, service_ws, max_queue: int):
+        self.service_ws = service_ws
+        self.max_queue = max_queue
+        self.credit_batch = max(1, max_queue // 4)
+        self.channels: dict[int, Channel] = {}
+        self.channel_ids = itertools.count(1)
+        self.reader = asyncio.create_task(self.read())
+
+    @classmethod
+    async def connect(cls, url: str, options: dict, max_queue: int) -> "UpstreamLink":
+        options = dict(options)
+        if options.get("max_size"):
+            # Room for the channel header and seq trailer on top of the largest relayed frame
+            options["max_size"] += MUX_HEADER.size + SEQ_TRAILER_SIZE
+        service_ws = await connect(url, subprotocols=[MUX_SUBPROTOCOL], **options)
+        logger.info(f"Upstream link established with {url}")
+        return cls(service_ws, max_queue)
+
+    @property
+    def is_open(self) -> bool:
+        return not self.reader.done()
+
+    async def send(self, channel_id: int, op: int, payload: bytes = b""):
+        await self.service_ws.send(pack_frame(channel_id, op, payload))
+
+    async def open_channel(self, path: str, subprotocols: list[str] | None, timeout: float) -> Channel:
+        channel_id = next(self.channel_ids) & 0xFFFFFFFF
+        channel = Channel(self, channel_id)
+        self.channels[channel_id] = channel
+        request = json.dumps({"path": path, "subprotocols": subprotocols or [], "window": self.max_queue})
+        try:
+            await self.send(channel_id, OP_OPEN, request.encode("utf-8"))
+            channel.subprotocol = await asyncio.wait_for(channel.accepted, timeout)
+        except BaseException:
+            await channel.close(1011)
+            raise
+        return channel
+
+    async def read(self):
+        try:
+            async for frame in self.service_ws:
+                if not isinstance(frame, bytes) or len(frame) < MUX_HEADER.size:
+                    continue
+                channel_id, op = MUX_HEADER.unpack_from(frame)
+                channel = self.channels.get(channel_id)
+                if channel is None:
+                    continue
+                payload = frame[MUX_HEADER.size:]
+                if op == OP_ACCEPT:
+                    if not channel.accepted.done():
+                        channel.accepted.set_result(payload.decode("utf-8") or None)
+                elif op in (OP_TEXT, OP_BINARY):
+                    message = payload.decode("utf-8") if op == OP_TEXT else payload
+                    if not channel.feed(message):
+                        # Draw-service sent past the channel's credit
+                        logger.warning(f"Channel {channel_id} overran its window, closing")
+                        await channel.close(1013)
+                elif op == OP_CLOSE:
+                    code = CLOSE_CODE.unpack(payload)[0] if len(payload) == CLOSE_CODE.size else 1000
+                    channel.closed(code)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            logger.info("Upstream link closed")
+            for channel in list(self.channels.values()):
+                channel.closed(1011)
+
+    async def close(self):
+        await self.service_ws.close()
+        await asyncio.gather(self.reader, return_exceptions=True)
+
+
+class UpstreamPool:
+    # A few links per backend, shared by every client socket routed to it
+    def __init__(self, url: str, size: int, timeout: float, options: dict, max_queue: int):
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self.options = options
+        self.max_queue = max_queue
+        self.links: list[UpstreamLink] = []
+        self.connect_lock = asyncio.Lock()
+
+    async def get_link(self) -> UpstreamLink:
+        self.links = [link for link in self.links if link.is_open]
+        if len(self.links) < self.size:
+            async with self.connect_lock:
+                if len(self.links) < self.size:
+                    link = await asyncio.wait_for(UpstreamLink.connect(self.url, self.options, self.max_queue), self.timeout)
+                    self.links.append(link)
+                    return link
+        return min(self.links, key=lambda link: len(link.channels))
+
+    async def open_channel(self, path: str, subprotocols: list[str] | None) -> Channel:
+        link = await self.get_link()
+        return await link.open_channel(path, subprotocols, self.timeout)
+
+    async def close(self):
+        links = self.links
+        self.links = []
+        await asyncio.gather(*(link.close() for link in links), return_exceptions=True)
+
+
+class UpstreamPools:
+    _instance = None
+
+    def __init__(self, size: int, timeout: float, options: dict, max_queue: int):
+        self.size = size
+        self.timeout = timeout
+        self.options = options
+        self.max_queue = max_queue
+        self.pools: dict[str, UpstreamPool] = {}
+
+    @classmethod
+    def get_instance(cls, size: int, timeout: float, options: dict, max_queue: int) -> "UpstreamPools":
+        if cls._instance is None:
+            cls._instance = cls(size, timeout, options, max_queue)
+        return cls._instance
+
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance:
+            await cls._instance.close()
+            cls._instance = None
+
+    def get_pool(self, url: str) -> UpstreamPool:
+        pool = self.pools.get(url)
+        if pool is None:
+            pool = self.pools[url] = UpstreamPool(url, self.size, self.timeout, self.options, self.max_queue)
+        return pool
+
+    async def close(self):
+        pools = list(self.pools.values())
+        self.pools.clear()
+        for pool in pools:
+            await pool.close()
@@ -0,0 +1,47 @@
+import { API_URL } from '../config/config';
+import { decodeSnapshot } from '../utils/StrokeCodec';
+
+export async function fetchSnapshot(roomId) {
+    const response = await fetch(`${API_URL}/draw/${roomId}/snapshot`);
+    if (!response.ok) {
+        throw new Error(`Failed to load snapshot: ${response.status}`);
+    }
+    const snapshot = decodeSnapshot(await response.arrayBuffer());
+    // Stream entry id the stored drawings cover; events after it are replayed over the socket
+    snapshot.streamSeq = response.headers.get('X-Stream-Seq');
+    return snapshot;
+}
+
+// Chunks not yet compacted into the snapshot; pass the snapshot's seq, since
+// the chunks it covers are deleted once compacted
+export async function streamDrawings(roomId, onChunk, afterSeq = 0) {
+    const response = await fetch(`${API_URL}/draw/${roomId}?after_seq=${afterSeq}`);
+    if (!response.ok) {
+        throw new Error(`Failed to load drawings: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let lastSeq = afterSeq;
+
+    const handleLine = (line) => {
+        if (!line) return;
+        const chunk = JSON.parse(line);
+        lastSeq = chunk.seq;
+        onChunk(chunk);
+    };
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+
+    return lastSeq;
+}
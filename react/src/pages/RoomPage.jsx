@@ -1,11 +1,16 @@
 import React, { useEffect, useRef, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import axiosInstance from '../apis/axiosInstance';
+import { fetchSnapshot, streamDrawings } from '../apis/drawStream';
 import { BASE_URL, API_URL, wsProtocol } from '../config/config';
 import { getUserId } from '../utils/Authenticate';
 import { getCurrentRoomId, setCurrentRoomId, clearCurrentRoomId } from '../utils/RoomUtils';
+import { BINARY_SUBPROTOCOL, encodeSegments, decodeFrame } from '../utils/StrokeCodec';
 import { Canvas, RoomInfo, PlayerList, Chat } from '../components';
 
+const RECONNECT_DELAY_MS = 1000;
+const MAX_RECONNECT_ATTEMPTS = 5;
+
 function RoomPage() {
     const { roomId } = useParams();
     const [roomDetails, setRoomDetails] = useState(null);
@@ -13,12 +18,35 @@ function RoomPage() {
     const [newMessage, setNewMessage] = useState("");
     const canvasRef = useRef(null);
     const [ctx, setCtx] = useState(null);
+    const [drawingsLoaded, setDrawingsLoaded] = useState(false);
     const socketRef = useRef(null);
     const prevCoordsRef = useRef({ prevX: 0, prevY: 0 });
+    const strokeIdRef = useRef(0);
+    const lastSeqRef = useRef(null);
     const navigate = useNavigate();
 
     const currentUser = getUserId();
 
+    const loadDrawings = async (context) => {
+        const snapshot = await fetchSnapshot(roomId);
+        snapshot.segments.forEach(({ x, y, prevX, prevY }) => {
+            context.beginPath();
+            context.moveTo(prevX, prevY);
+            context.lineTo(x, y);
+            context.stroke();
+        });
+
+        await streamDrawings(roomId, ({ segments }) => {
+            segments.forEach(([x, y, prevX, prevY]) => {
+                context.beginPath();
+                context.moveTo(prevX, prevY);
+                context.lineTo(x, y);
+                context.stroke();
+            });
+        }, snapshot.seq);
+        return snapshot.streamSeq;
+    };
+
     useEffect(() => {
         const currentRoomId = getCurrentRoomId();
         if (currentRoomId && currentRoomId !== roomId) {
@@ -32,17 +60,12 @@ function RoomPage() {
                 const roomResponse = await axiosInstance.get(`/room/${roomId}`);
                 setRoomDetails(roomResponse.data);
 
-                const drawingsResponse = await axiosInstance.get(`/draw/${roomId}`);
                 const context = canvasRef.current.getContext("2d");
 
                 if (context) {
                     setCtx(context);
-                    drawingsResponse.data.forEach(({ x, y, prevX, prevY }) => {
-                        context.beginPath();
-                        context.moveTo(prevX, prevY);
-                        context.lineTo(x, y);
-                        context.stroke();
-                    });
+                    lastSeqRef.current = await loadDrawings(context);
+                    setDrawingsLoaded(true);
                 }
             } catch (error) {
                 navigate('/')
@@ -65,37 +88,103 @@ function RoomPage() {
     }, [roomDetails]);
 
     useEffect(() => {
-        if (!ctx || !roomDetails) return;
-
-        const ws = new WebSocket(`${wsProtocol}://${BASE_URL}/ws/draw/${roomId}/user/${currentUser}`);
-        socketRef.current = ws;
-
-        ws.onopen = () => { };
-
-        ws.onmessage = (event) => {
-            const data = JSON.parse(event.data);
-            if (data.type === 'draw') {
-                const { x, y, prevX, prevY } = data;
-                ctx.beginPath();
-                ctx.moveTo(prevX, prevY);
-                ctx.lineTo(x, y);
-                ctx.stroke();
-            } else if (data.type === 'chat') {
-                const message = `${data.email}: ${data.message}`;
-                setChatMessages((prevMessages) => [...prevMessages, message]);
-
-                setTimeout(() => {
-                    setChatMessages((prevMessages) => prevMessages.slice(1));
-                }, 10000);
+        if (!ctx || !roomDetails || !drawingsLoaded) return;
+
+        let ws;
+        let closing = false;
+        let connected = false;
+        let failedAttempts = 0;
+        let needsReload = false;
+        let reconnectTimer;
+
+        const reconnect = async () => {
+            // Redraw from storage, then resume the stream where storage ends;
+            // without a cursor there is nothing to resume from either
+            if (needsReload || !lastSeqRef.current) {
+                ctx.clearRect(0, 0, ctx.canvas.width, ctx.canvas.height);
+                try {
+                    lastSeqRef.current = await loadDrawings(ctx);
+                    needsReload = false;
+                } catch (error) {
+                    console.error('Error resyncing canvas:', error);
+                    if (!closing && failedAttempts < MAX_RECONNECT_ATTEMPTS) {
+                        failedAttempts += 1;
+                        reconnectTimer = setTimeout(reconnect, RECONNECT_DELAY_MS * failedAttempts);
+                    }
+                    return;
+                }
             }
+            if (!closing) connect();
         };
 
-        ws.onclose = () => { };
+        const connect = () => {
+            // After a drop, resume from the last stamped event instead of reloading the canvas
+            const query = lastSeqRef.current ? `?last_seq=${lastSeqRef.current}` : '';
+            ws = new WebSocket(`${wsProtocol}://${BASE_URL}/ws/draw/${roomId}/user/${currentUser}${query}`, [BINARY_SUBPROTOCOL]);
+            ws.binaryType = 'arraybuffer';
+            socketRef.current = ws;
+
+            ws.onopen = () => {
+                connected = true;
+            };
+
+            ws.onmessage = (event) => {
+                if (event.data instanceof ArrayBuffer) {
+                    failedAttempts = 0;
+                    const { segments, seq } = decodeFrame(event.data);
+                    segments.forEach(({ x, y, prevX, prevY }) => {
+                        ctx.beginPath();
+                        ctx.moveTo(prevX, prevY);
+                        ctx.lineTo(x, y);
+                        ctx.stroke();
+                    });
+                    if (seq) lastSeqRef.current = seq;
+                    return;
+                }
+
+                const data = JSON.parse(event.data);
+                if (data.type !== 'resync') failedAttempts = 0;
+                if (data.type === 'draw') {
+                    const { x, y, prevX, prevY } = data;
+                    ctx.beginPath();
+                    ctx.moveTo(prevX, prevY);
+                    ctx.lineTo(x, y);
+                    ctx.stroke();
+                } else if (data.type === 'resync') {
+                    // The server dropped frames we were too slow to receive,
+                    // or could not replay what we missed; reload and reconnect
+                    needsReload = true;
+                    ws.close();
+                } else if (data.type === 'chat') {
+                    const message = `${data.email}: ${data.message}`;
+                    setChatMessages((prevMessages) => [...prevMessages, message]);
+
+                    setTimeout(() => {
+                        setChatMessages((prevMessages) => prevMessages.slice(1));
+                    }, 10000);
+                }
+            };
+
+            ws.onclose = () => {
+                // Only sockets that got in once retry; a refused join (full room) does not.
+                // Drops and resyncs count alike until a socket delivers something again,
+                // so neither a room that stays full nor repeated resyncs retry forever.
+                if (closing || !connected) return;
+                if (failedAttempts >= MAX_RECONNECT_ATTEMPTS) return;
+                failedAttempts += 1;
+                // The first resync reloads right away, repeated ones back off
+                const delay = RECONNECT_DELAY_MS * (needsReload ? failedAttempts - 1 : failedAttempts);
+                reconnectTimer = setTimeout(reconnect, delay);
+            };
+        };
+        connect();
 
         return () => {
+            closing = true;
+            clearTimeout(reconnectTimer);
             ws.close();
         };
-    }, [roomId, roomDetails, currentUser, ctx]);
+    }, [roomId, roomDetails, currentUser, ctx, drawingsLoaded]);
 
     const handleMouseMove = (event) => {
         if (event.buttons !== 1 || !ctx) return;
@@ -111,9 +200,14 @@ function RoomPage() {
         ctx.lineTo(x, y);
         ctx.stroke();
 
-        if (socketRef.current && socketRef.current.readyState === WebSocket.OPEN) {
-            const drawingData = { type: 'draw', x, y, prevX, prevY };
-            socketRef.current.send(JSON.stringify(drawingData));
+        const socket = socketRef.current;
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            if (socket.protocol === BINARY_SUBPROTOCOL) {
+                socket.send(encodeSegments([{ x, y, prevX, prevY }], strokeIdRef.current));
+            } else {
+                const drawingData = { type: 'draw', x, y, prevX, prevY };
+                socket.send(JSON.stringify(drawingData));
+            }
         }
 
         prevCoordsRef.current.prevX = x;
@@ -129,6 +223,7 @@ function RoomPage() {
 
         prevCoordsRef.current.prevX = x;
         prevCoordsRef.current.prevY = y;
+        strokeIdRef.current = (strokeIdRef.current + 1) & 0xffff;
     };
 
     const handleDeleteRoom = async () => {
@@ -0,0 +1,81 @@
+export const BINARY_SUBPROTOCOL = 'quickdraw.v1.bin';
+
+const DRAW_SEGMENTS = 0x01;
+const STREAM_SEQ = 0x02;
+const HEADER_SIZE = 5;
+const SEGMENT_SIZE = 8;
+const SEQ_SIZE = 16;
+const COORD_SCALE = 4;
+
+const quantize = (value) => Math.max(-32768, Math.min(32767, Math.round(value * COORD_SCALE)));
+
+export function encodeSegments(segments, strokeId = 0) {
+    const buffer = new ArrayBuffer(HEADER_SIZE + SEGMENT_SIZE * segments.length);
+    const view = new DataView(buffer);
+    view.setUint8(0, DRAW_SEGMENTS);
+    view.setUint16(1, strokeId & 0xffff, true);
+    view.setUint16(3, segments.length, true);
+
+    let offset = HEADER_SIZE;
+    segments.forEach(({ x, y, prevX, prevY }) => {
+        view.setInt16(offset, quantize(x), true);
+        view.setInt16(offset + 2, quantize(y), true);
+        view.setInt16(offset + 4, quantize(prevX), true);
+        view.setInt16(offset + 6, quantize(prevY), true);
+        offset += SEGMENT_SIZE;
+    });
+    return buffer;
+}
+
+function unpackPoints(view, offset, count, segments) {
+    for (let i = 0; i < count; i++) {
+        segments.push({
+            x: view.getInt16(offset, true) / COORD_SCALE,
+            y: view.getInt16(offset + 2, true) / COORD_SCALE,
+            prevX: view.getInt16(offset + 4, true) / COORD_SCALE,
+            prevY: view.getInt16(offset + 6, true) / COORD_SCALE,
+        });
+        offset += SEGMENT_SIZE;
+    }
+    return offset;
+}
+
+// Returns the segments and, when the server stamped the frame, the stream
+// entry id ("ms-seq") of its last event to resume from after a reconnect.
+export function decodeFrame(buffer) {
+    const view = new DataView(buffer);
+    const segments = [];
+    let seq = null;
+
+    let offset = 0;
+    while (offset + HEADER_SIZE <= view.byteLength) {
+        const type = view.getUint8(offset);
+        const count = view.getUint16(offset + 3, true);
+        offset += HEADER_SIZE;
+
+        if (type === STREAM_SEQ) {
+            if (offset + SEQ_SIZE > view.byteLength) break;
+            seq = `${view.getBigUint64(offset, true)}-${view.getBigUint64(offset + 8, true)}`;
+            offset += SEQ_SIZE;
+            continue;
+        }
+        if (type !== DRAW_SEGMENTS || offset + count * SEGMENT_SIZE > view.byteLength) break;
+
+        offset = unpackPoints(view, offset, count, segments);
+    }
+    return { segments, seq };
+}
+
+export function decodeSegments(buffer) {
+    return decodeFrame(buffer).segments;
+}
+
+// Snapshot body: uint64 seq, uint32 segment count, then packed segments
+export function decodeSnapshot(buffer) {
+    const view = new DataView(buffer);
+    const seq = Number(view.getBigUint64(0, true));
+    const count = view.getUint32(8, true);
+    const segments = [];
+    unpackPoints(view, 12, count, segments);
+    return { seq, segments };
+}